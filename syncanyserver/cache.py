@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from syncanysql.executor import Executor
+from syncanysql.parser import FileParser
+from .columnar import ColumnarDatas
+
+
+class TableScriptCache(object):
+    def __init__(self):
+        self.scripts = {}
+        self.lock = threading.Lock()
+
+    def get_version(self, filename):
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, filename):
+        version = self.get_version(filename)
+        with self.lock:
+            script = self.scripts.get(filename)
+            if script is not None and script[0] == version:
+                return script[1]
+        sql_parser = FileParser(filename)
+        sqls = sql_parser.load()
+        with self.lock:
+            self.scripts[filename] = (version, sqls)
+        return sqls
+
+    def is_referenced(self, filename, name):
+        return any(name in sql.sql for sql in self.load(filename))
+
+    def invalidate(self, filename):
+        with self.lock:
+            self.scripts.pop(filename, None)
+
+    def clear(self):
+        with self.lock:
+            self.scripts.clear()
+
+
+def get_datas_size(datas, sample_count=100):
+    if isinstance(datas, ColumnarDatas):
+        return datas.get_size(sample_count)
+    if not datas:
+        return sys.getsizeof(datas)
+    sample_size, sample_datas = 0, datas[:sample_count]
+    for data in sample_datas:
+        sample_size += sys.getsizeof(data)
+        for value in (data.values() if isinstance(data, dict) else data):
+            sample_size += sys.getsizeof(value)
+    return sys.getsizeof(datas) + int(sample_size * len(datas) / len(sample_datas))
+
+
+class ResultCache(object):
+    def __init__(self, max_size=0):
+        self.max_size = max_size
+        self.size = 0
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def build_key(self, database_name, table_name, version, env_variables):
+        env_variables_layers = []
+        while env_variables is not None and env_variables is not Executor.global_env_variables:
+            env_variables_layers.append(env_variables)
+            env_variables = env_variables.parent
+        variables = {}
+        for env_variables in reversed(env_variables_layers):
+            variables.update(env_variables)
+        return (database_name, table_name, version,
+                tuple(sorted((key, repr(value)) for key, value in variables.items())))
+
+    def get(self, key):
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            if result[0] <= time.time():
+                self.results.pop(key)
+                self.size -= result[1]
+                self.misses += 1
+                return None
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result[2]
+
+    def set(self, key, datas, ttl):
+        size = get_datas_size(datas)
+        if size > self.max_size:
+            return False
+        with self.lock:
+            result = self.results.pop(key, None)
+            if result is not None:
+                self.size -= result[1]
+            while self.results and self.size + size > self.max_size:
+                _, result = self.results.popitem(last=False)
+                self.size -= result[1]
+                self.evictions += 1
+            self.results[key] = (time.time() + ttl, size, datas)
+            self.size += size
+        return True
+
+    def invalidate(self, database_name=None, table_name=None):
+        with self.lock:
+            for key in list(self.results.keys()):
+                if database_name is not None and key[0] != database_name:
+                    continue
+                if table_name is not None and key[1] != table_name:
+                    continue
+                self.size -= self.results.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.results), "size": self.size, "max_size": self.max_size}
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import sys
+from array import array
+from itertools import islice
+
+COLUMNAR_MIN_ROWS = 256
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+class ArrayColumn(object):
+    def __init__(self, values, nulls=None):
+        self.values = values
+        self.nulls = nulls
+
+    def __getitem__(self, index):
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return self.values[index]
+
+    def __iter__(self):
+        if self.nulls is None:
+            return iter(self.values)
+        return (None if is_null else value for value, is_null in zip(self.values, self.nulls))
+
+    def get_size(self):
+        return self.values.itemsize * len(self.values) + (len(self.nulls) if self.nulls is not None else 0)
+
+
+class DictionaryColumn(object):
+    def __init__(self, codes, dictionary):
+        self.codes = codes
+        self.dictionary = dictionary
+
+    def __getitem__(self, index):
+        return self.dictionary[self.codes[index]]
+
+    def __iter__(self):
+        return map(self.dictionary.__getitem__, self.codes)
+
+    def get_size(self):
+        return self.codes.itemsize * len(self.codes) + sys.getsizeof(self.dictionary) \
+               + sum(sys.getsizeof(value) for value in self.dictionary)
+
+
+def build_array_column(values):
+    value_type, has_null = None, False
+    for value in values:
+        if value is None:
+            has_null = True
+            continue
+        if value.__class__ is int:
+            if value < INT64_MIN or value > INT64_MAX or value_type == "d":
+                return None
+            value_type = "q"
+        elif value.__class__ is float:
+            if value_type == "q":
+                return None
+            value_type = "d"
+        else:
+            return None
+    if value_type is None:
+        return None
+    if not has_null:
+        return ArrayColumn(array(value_type, values))
+    default_value = 0 if value_type == "q" else 0.0
+    return ArrayColumn(array(value_type, (default_value if value is None else value for value in values)),
+                       bytearray(value is None for value in values))
+
+
+def build_dictionary_column(values):
+    indexes, dictionary, codes = {}, [], []
+    try:
+        for value in values:
+            value_key = (value.__class__, value)
+            code = indexes.get(value_key)
+            if code is None:
+                if len(indexes) * 2 > len(values):
+                    return None
+                code = indexes[value_key] = len(dictionary)
+                dictionary.append(value)
+            codes.append(code)
+    except TypeError:
+        return None
+    code_type = "B" if len(dictionary) <= 0xff else ("H" if len(dictionary) <= 0xffff else "I")
+    return DictionaryColumn(array(code_type, codes), dictionary)
+
+
+class ColumnarDatas(object):
+    def __init__(self, keys, columns, count):
+        self.keys = keys
+        self.columns = columns
+        self.count = count
+
+    @classmethod
+    def from_datas(cls, datas):
+        keys = tuple(datas[0].keys())
+        for data in datas:
+            if data.__class__ is not dict or len(data) != len(keys) or tuple(data.keys()) != keys:
+                return None
+        columns = []
+        for key in keys:
+            values = [data[key] for data in datas]
+            column = build_array_column(values)
+            if column is None:
+                column = build_dictionary_column(values)
+            columns.append(column if column is not None else tuple(values))
+        return cls(keys, columns, len(datas))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        keys = self.keys
+        for values in zip(*self.columns):
+            yield dict(zip(keys, values))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            keys = self.keys
+            return [dict(zip(keys, values)) for values in islice(zip(*self.columns), start, stop, step)] \
+                if step > 0 else [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("columnar datas index out of range")
+        return {key: column[index] for key, column in zip(self.keys, self.columns)}
+
+    def get_size(self, sample_count=100):
+        size = sys.getsizeof(self.keys) + sys.getsizeof(self.columns)
+        for column in self.columns:
+            if not isinstance(column, tuple):
+                size += column.get_size()
+                continue
+            sample_values = column[:sample_count]
+            size += sys.getsizeof(column)
+            if sample_values:
+                size += int(sum(sys.getsizeof(value) for value in sample_values) * len(column) / len(sample_values))
+        return size
+
+
+def compact_datas(datas):
+    if isinstance(datas, ColumnarDatas) or not isinstance(datas, list) or len(datas) < COLUMNAR_MIN_ROWS:
+        return datas
+    return ColumnarDatas.from_datas(datas) or datas
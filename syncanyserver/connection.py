@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import io
+from mysql_mimic import types, packets
+from mysql_mimic.connection import Connection
+from mysql_mimic.prepared import PreparedStatement, REGEX_PARAM
+from mysql_mimic.results import ensure_result_set
+from .spill import close_result
+
+
+class ServerConnection(Connection):
+    async def handle_query(self, data):
+        com_query = packets.parse_com_query(
+            capabilities=self.capabilities,
+            client_charset=self.client_charset,
+            data=data,
+        )
+
+        result_set = await self.query(com_query.sql, com_query.query_attrs)
+        if not result_set:
+            await self.stream.write(self.ok())
+            self.finish_sending()
+            return
+        if not hasattr(result_set.rows, "__aiter__"):
+            try:
+                for packet in self.text_resultset(result_set):
+                    await self.stream.write(packet)
+            finally:
+                close_result(result_set)
+                self.finish_sending()
+            return
+
+        await self.stream.write(packets.make_column_count(capabilities=self.capabilities,
+                                                          column_count=len(result_set.columns)))
+        for column in result_set.columns:
+            await self.stream.write(packets.make_column_definition_41(
+                server_charset=self.server_charset,
+                name=column.name,
+                column_type=column.type,
+                character_set=column.character_set,
+            ))
+        if not self.deprecate_eof():
+            await self.stream.write(self.eof())
+
+        affected_rows = 0
+        try:
+            async for row in result_set.rows:
+                affected_rows += 1
+                await self.stream.write(packets.make_text_resultset_row(row, result_set.columns))
+            await self.stream.write(self.ok_or_eof(affected_rows=affected_rows))
+        finally:
+            await result_set.rows.aclose()
+            self.finish_sending()
+
+    async def handle_stmt_prepare(self, data):
+        sql = self.client_charset.decode(data)
+        stmt = PreparedStatement(stmt_id=next(self.prepared_stmt_seq), sql=sql,
+                                 num_params=len(REGEX_PARAM.findall(sql)))
+        plan = self.session.prepare(sql) if hasattr(self.session, "prepare") else None
+        stmt.plan = plan if plan is not None and plan.slot_count == stmt.num_params else None
+        self.prepared_stmts[stmt.stmt_id] = stmt
+        for packet in self.com_stmt_prepare_response(stmt):
+            await self.stream.write(packet)
+
+    def parse_stmt_execute(self, data):
+        reader = io.BytesIO(data)
+        stmt = self.get_stmt(types.read_uint_4(reader))
+        use_cursor, param_count_available = packets._read_cursor_flags(reader)
+        types.read_uint_4(reader)
+        parameter_count = stmt.num_params
+        if types.Capabilities.CLIENT_QUERY_ATTRIBUTES in self.capabilities \
+                and (stmt.num_params > 0 or param_count_available):
+            parameter_count = types.read_uint_len(reader)
+        params = packets._read_params(self.capabilities, self.client_charset, reader, parameter_count,
+                                      stmt.param_buffers) if parameter_count > 0 else []
+        return stmt, use_cursor, [value for _, value in params[:stmt.num_params]], \
+               {name: value for name, value in params[stmt.num_params:] if name is not None}
+
+    async def query_stmt(self, stmt, params, query_attrs):
+        if getattr(stmt, "plan", None) is not None:
+            return ensure_result_set(await self.session.handle_prepared_query(stmt.plan, params, query_attrs))
+        if params and hasattr(self.session, "bind_sql"):
+            return await self.query(self.session.bind_sql(stmt.sql, params), query_attrs)
+        return await self.query(stmt.sql, query_attrs)
+
+    async def handle_stmt_execute(self, data):
+        stmt, use_cursor, params, query_attrs = self.parse_stmt_execute(data)
+        stmt.param_buffers = None
+
+        result_set = await self.query_stmt(stmt, params, query_attrs)
+        if not result_set:
+            await self.stream.write(self.ok())
+            self.finish_sending()
+            return
+
+        if hasattr(result_set.rows, "__aiter__") and use_cursor:
+            rows = result_set.rows
+            try:
+                result_set.rows = [row async for row in rows]
+            finally:
+                await rows.aclose()
+        if use_cursor:
+            stmt.cursor = self.binary_resultrows(result_set)
+
+        try:
+            await self.stream.write(types.uint_len(len(result_set.columns)))
+            for column in result_set.columns:
+                await self.stream.write(packets.make_column_definition_41(
+                    server_charset=self.server_charset,
+                    name=column.name,
+                    column_type=column.type,
+                    character_set=column.character_set,
+                ))
+
+            if use_cursor:
+                await self.stream.write(self.ok_or_eof(flags=types.ServerStatus.SERVER_STATUS_CURSOR_EXISTS))
+                return
+
+            if not self.deprecate_eof():
+                await self.stream.write(self.eof())
+            if hasattr(result_set.rows, "__aiter__"):
+                async for row in result_set.rows:
+                    await self.stream.write(packets.make_binary_resultrow(row, result_set.columns))
+            else:
+                for row in result_set.rows:
+                    await self.stream.write(packets.make_binary_resultrow(row, result_set.columns))
+            await self.stream.write(self.ok_or_eof())
+        finally:
+            if not use_cursor:
+                if hasattr(result_set.rows, "aclose"):
+                    await result_set.rows.aclose()
+                else:
+                    close_result(result_set)
+            self.finish_sending()
+
+    def finish_sending(self):
+        if hasattr(self.session, "finish_sending"):
+            self.session.finish_sending()
+
+    def binary_resultrows(self, result_set):
+        try:
+            for row in result_set.rows:
+                yield packets.make_binary_resultrow(row, result_set.columns)
+        finally:
+            close_result(result_set)
@@ -4,8 +4,16 @@
 
 import asyncio
 import os
+import time
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from mysql_mimic.results import ColumnType
+from mysql_mimic.errors import MysqlError
 from syncany.logger import get_logger
+from syncany.database import find_database
 from syncany.database.database import DatabaseManager as BaseDatabaseManager, DatabaseDriver
 from syncany.taskers.config import load_config
 from syncany.filters import find_filter
@@ -13,11 +21,94 @@ from syncanysql.compiler import Compiler
 from syncanysql.executor import Executor
 from syncanysql.parser import FileParser
 from syncanysql.taskers.query import QueryTasker
-from syncanysql import ExecuterContext
+from syncanysql import ExecuterContext, version as syncanysql_version
 from .table import Table
 
 
+ER_CON_COUNT_ERROR = 1040
+POOL_CHECK_INTERVAL = 5 * 60
+POOL_WAIT_TIMEOUT = 30
+
+
+class DatabasePoolExhausted(MysqlError):
+    def __init__(self, name, max_size, wait_timeout):
+        super(DatabasePoolExhausted, self).__init__("Too many connections, database %s pool of %d connections "
+                                                    "exhausted after waiting %ss" % (name, max_size, wait_timeout),
+                                                    ER_CON_COUNT_ERROR)
+        self.name = name
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+
+    def __reduce__(self):
+        return self.__class__, (self.name, self.max_size, self.wait_timeout)
+
+
+class DatabasePool(object):
+    def __init__(self, name=None, database=None, min_size=0, max_size=0, idle_timeout=None, ping_idle_timeout=None,
+                 wait_timeout=POOL_WAIT_TIMEOUT, warmup=True):
+        self.name = name
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_idle_timeout = ping_idle_timeout
+        self.wait_timeout = wait_timeout
+        self.warmup = warmup
+        self.waits = 0
+        self.wait_time = 0
+        self.created = 0
+        self.closed = 0
+        self.ping_failures = 0
+
+    @classmethod
+    def load(cls, name, database, config):
+        if not isinstance(config, dict):
+            raise ValueError("pool config must be an object")
+        pool = cls(name, database, int(config.get("min_size", 0)), int(config.get("max_size", 0)),
+                   float(config["idle_timeout"]) if config.get("idle_timeout") is not None else None,
+                   float(config["ping_idle_timeout"]) if config.get("ping_idle_timeout") is not None else None,
+                   float(config.get("wait_timeout", POOL_WAIT_TIMEOUT)), bool(config.get("warmup", True)))
+        if pool.min_size < 0 or pool.max_size < 0 or (pool.max_size and pool.min_size > pool.max_size):
+            raise ValueError("pool size error, min_size %d max_size %d" % (pool.min_size, pool.max_size))
+        return pool
+
+    def get_stats(self):
+        return {"min_size": self.min_size, "max_size": self.max_size, "waits": self.waits,
+                "wait_time": self.wait_time, "created": self.created, "closed": self.closed,
+                "ping_failures": self.ping_failures}
+
+
 class DatabaseManager(BaseDatabaseManager):
+    def __init__(self, *args, **kwargs):
+        super(DatabaseManager, self).__init__(*args, **kwargs)
+
+        self.acquire_count = 0
+        self.using_counts = defaultdict(int)
+        self.pools = {}
+        self.condition = threading.Condition(self.lock)
+
+    def configure(self, database_configs):
+        for config in database_configs:
+            if not isinstance(config, dict) or not config.get("driver") or config.get("name") in ("-", "--"):
+                continue
+            name, pool_config = config["name"], config.pop("pool", None)
+            try:
+                database = find_database(config["driver"])(self, {key: value for key, value in config.items()
+                                                                  if key != "driver"}).build()
+                pool = DatabasePool.load(name, database, pool_config if pool_config is not None else {})
+            except Exception as e:
+                get_logger().warning("database %s pool config error: %s", name, e)
+                continue
+            with self.lock:
+                self.pools[database.get_config_key()] = pool
+
+    def get_pool(self, key):
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = DatabasePool()
+            self.pools[key] = pool
+        return pool
+
     def acquire(self, key):
         if key.startswith("MemoryDB://") and "name=--" in key:
             try:
@@ -25,10 +116,75 @@ class DatabaseManager(BaseDatabaseManager):
                 if executer_context:
                     if hasattr(executer_context, "memory_database_collection"):
                         return DatabaseDriver(self.factorys[key], executer_context.memory_database_collection)
-                    return super(DatabaseManager, self).acquire(key)
+                    return self.acquire_driver(key)
             except:
                 pass
-        return super(DatabaseManager, self).acquire(key)
+        return self.acquire_driver(key)
+
+    def acquire_driver(self, key):
+        with self.lock:
+            pool = self.get_pool(key)
+            if pool.max_size > 0 and self.using_counts.get(key, 0) >= pool.max_size:
+                self.wait_pool(key, pool)
+            self.acquire_count += 1
+            self.using_counts[key] += 1
+        try:
+            return self.checkout(key, pool)
+        except BaseException:
+            self.release_using(key)
+            raise
+
+    def wait_pool(self, key, pool):
+        start_time = time.time()
+        pool.waits += 1
+        try:
+            while self.using_counts.get(key, 0) >= pool.max_size:
+                timeout = pool.wait_timeout - (time.time() - start_time)
+                if timeout <= 0:
+                    raise DatabasePoolExhausted(pool.name or key.split("://")[0], pool.max_size, pool.wait_timeout)
+                self.condition.wait(timeout)
+        finally:
+            pool.wait_time += time.time() - start_time
+
+    def checkout(self, key, pool):
+        with self.lock:
+            factory = self.factorys[key]
+        ping_idle_timeout = self.ping_idle_timeout if pool.ping_idle_timeout is None else pool.ping_idle_timeout
+        while True:
+            with factory.lock:
+                if not factory.drivers:
+                    break
+                driver = factory.pop()
+            if time.time() - driver.idle_time < ping_idle_timeout:
+                return driver
+            try:
+                if driver.ping():
+                    return driver
+            except Exception:
+                pass
+            with self.lock:
+                pool.ping_failures += 1
+            self.close_driver(pool, driver)
+        driver = DatabaseDriver(factory, factory.create())
+        with self.lock:
+            pool.created += 1
+        return driver
+
+    def close_driver(self, pool, driver):
+        try:
+            driver.close()
+        except Exception:
+            pass
+        with self.lock:
+            pool.closed += 1
+
+    def release_using(self, key):
+        with self.lock:
+            if self.using_counts.get(key, 0) > 1:
+                self.using_counts[key] -= 1
+            else:
+                self.using_counts.pop(key, None)
+            self.condition.notify_all()
 
     def release(self, key, driver):
         if key.startswith("MemoryDB://") and "name=--" in key:
@@ -39,25 +195,105 @@ class DatabaseManager(BaseDatabaseManager):
                     return
             except:
                 pass
+        self.release_using(key)
+        if driver.closed:
+            with self.lock:
+                self.get_pool(key).closed += 1
+            return
         return super(DatabaseManager, self).release(key, driver)
 
+    def warmup(self):
+        with self.lock:
+            pools = [(key, pool) for key, pool in self.pools.items()
+                     if pool.database is not None and pool.warmup and pool.min_size > 0]
+        for key, pool in pools:
+            count = 0
+            try:
+                if not self.has(key):
+                    self.register(key, pool.database.build_factory())
+                with self.lock:
+                    factory = self.factorys[key]
+                while len(factory.drivers) + self.using_counts.get(key, 0) < pool.min_size:
+                    driver = DatabaseDriver(factory, factory.create())
+                    with self.lock:
+                        pool.created += 1
+                    with factory.lock:
+                        factory.append(driver)
+                    count += 1
+            except Exception as e:
+                get_logger().warning("database %s pool warmup error: %s", pool.name, e)
+            get_logger().info("database %s pool warmup %d connections", pool.name, count)
+
+    def get_stats(self):
+        stats = defaultdict(lambda: {"factorys": 0, "idle": 0, "using": 0})
+        with self.lock:
+            factorys = list(self.factorys.items())
+            using_counts = dict(self.using_counts)
+        for key, factory in factorys:
+            driver_stats = stats[key.split("://")[0] if "://" in key else factory.__class__.__name__]
+            driver_stats["factorys"] += 1
+            driver_stats["idle"] += len(factory.drivers)
+            driver_stats["using"] += using_counts.get(key, 0)
+        return dict(stats)
+
+    def get_pool_stats(self):
+        with self.lock:
+            pools = [(pool, self.factorys.get(key), self.using_counts.get(key, 0))
+                     for key, pool in self.pools.items() if pool.name is not None]
+        stats = {}
+        for pool, factory, using_count in pools:
+            pool_stats = {"using": using_count, "idle": len(factory.drivers) if factory else 0}
+            pool_stats.update(pool.get_stats())
+            stats[pool.name] = pool_stats
+        return stats
+
     def remove(self, key):
         with self.lock:
             factory = self.factorys.pop(key, None)
+            pool = self.pools.get(key) or DatabasePool()
         if not factory:
             return
         with factory.lock:
-            while factory.drivers:
-                driver = factory.drivers.popleft()
-                driver.close()
+            drivers = list(factory.drivers)
+            factory.drivers.clear()
+        for driver in drivers:
+            self.close_driver(pool, driver)
+
+    def evict_idle_drivers(self):
+        now = time.time()
+        with self.lock:
+            factorys = list(self.factorys.items())
+        for key, factory in factorys:
+            with self.lock:
+                pool = self.get_pool(key)
+                using_count = self.using_counts.get(key, 0)
+            idle_timeout = self.idle_timeout if pool.idle_timeout is None else pool.idle_timeout
+            drivers = []
+            with factory.lock:
+                while factory.drivers and len(factory.drivers) + using_count > pool.min_size \
+                        and now - factory.drivers[0].idle_time > idle_timeout:
+                    drivers.append(factory.drivers.popleft())
+            for driver in drivers:
+                self.close_driver(pool, driver)
+            if pool.name is None:
+                with self.lock:
+                    if not factory.drivers and not self.using_counts.get(key) and self.factorys.get(key) is factory:
+                        self.factorys.pop(key, None)
+                        self.pools.pop(key, None)
+
+    def get_check_interval(self):
+        with self.lock:
+            idle_timeouts = [pool.idle_timeout for pool in self.pools.values()
+                             if pool.name is not None and pool.idle_timeout is not None]
+        return max(min([POOL_CHECK_INTERVAL] + [idle_timeout / 2 for idle_timeout in idle_timeouts]), 1)
 
     def check_timeout(self):
         if self.closed:
             return
         try:
-            super(DatabaseManager, self).check_timeout()
+            self.evict_idle_drivers()
         finally:
-            asyncio.get_running_loop().call_later(5 * 60, self.check_timeout)
+            asyncio.get_running_loop().call_later(self.get_check_interval(), self.check_timeout)
 
 
 class Database(object):
@@ -74,32 +310,216 @@ class Database(object):
 
     def __init__(self, name, tables):
         self.name = name
-        self.tables = tables
+        self.tables = tuple(tables)
+        self.table_indexes = {}
+        self.schema_indexes = {}
+        for table in self.tables:
+            if table.filename is not None and table.name not in self.table_indexes:
+                self.table_indexes[table.name] = table
+            if table.name not in self.schema_indexes:
+                self.schema_indexes[table.name] = table.schema
 
     def get_table(self, table_name):
-        for table in self.tables:
-            if table.name == table_name and table.filename is not None:
-                return table
-        return None
+        return self.table_indexes.get(table_name)
 
     def get_table_schema(self, table_name):
-        for table in self.tables:
-            if table.name == table_name:
-                return table.schema
+        return self.schema_indexes.get(table_name)
+
+    def get_column_schema(self, table_name, column_name):
+        table_schema = self.schema_indexes.get(table_name)
+        if table_schema is None:
+            return None
+        return table_schema.get(column_name)
+
+    @classmethod
+    def scan_databases(cls, config_path, script_engine, catalog, is_scan_database, table_script_cache=None,
+                       is_full=True, scan_manifest=None, is_flush=False):
+        if catalog.scanner is None:
+            catalog.scanner = CatalogScanner(config_path, script_engine, catalog, is_scan_database, table_script_cache,
+                                             scan_manifest)
+        return catalog.scanner.scan(is_full, is_flush)
+
+    @classmethod
+    def load_sql_tables(cls, database_name, table_name, filename, script_engine, table_script_cache=None):
+        get_logger().info("load database sql file parse %s %s", database_name, filename)
+        if table_script_cache is not None:
+            sqls = table_script_cache.load(filename)
+        else:
+            sql_parser = FileParser(filename)
+            sqls = sql_parser.load()
+        executor = Executor(script_engine.manager, script_engine.executor.session_config.session(),
+                            script_engine.executor)
+        executor.run("scan", sqls)
+        tables = []
+        if not executor.runners:
+            return tables
+        for tasker in executor.runners:
+            try:
+                if not isinstance(tasker, QueryTasker):
+                    continue
+                if ("&.--." + table_name) in tasker.config["output"]:
+                    output_info = tasker.config["output"].split("&.--.")[-1].split("::")
+                    table_name = output_info[0]
+                    primary_keys = output_info[1].split(" ")[0].split("+") if len(output_info) >= 2 else None
+                    tables.append(Table(table_name, filename, Table.parse_schema(tasker), primary_keys))
+                    get_logger().info("load database append table %s %s %s", database_name, table_name, filename)
+                elif tasker.reduce_config and ("&.--." + table_name) in tasker.reduce_config["output"]:
+                    output_info = tasker.reduce_config["output"].split("&.--.")[-1].split("::")
+                    table_name = output_info[0]
+                    primary_keys = output_info[1].split(" ")[0].split("+") if len(output_info) >= 2 else None
+                    tables.append(Table(table_name, filename, Table.parse_schema(tasker), primary_keys))
+                    get_logger().info("load database append table %s %s %s", database_name, table_name, filename)
+                else:
+                    get_logger().warning("load database file no output table memory db %s %s %s", database_name, table_name, filename)
+            finally:
+                tasker.tasker.close()
+        return tables
+
+    @classmethod
+    def load_table_meta(cls, database_name, filename):
+        try:
+            get_logger().info("load database meta file parse %s %s", database_name, filename)
+            table_meta = load_config(filename)
+            if not isinstance(table_meta, dict):
+                return None
+            return table_meta
+        except Exception as e:
+            get_logger().warning("load meta file error %s %s", filename, str(e))
         return None
 
     @classmethod
-    def scan_databases(cls, config_path, script_engine, databases, is_scan_database):
-        new_databases = {}
-        if is_scan_database:
+    def apply_table_meta(cls, database_name, table_name, table_meta, tables, filename):
+        table_options = {key: value for key, value in table_meta.items() if key != "schema"}
+        if "schema" not in table_meta or not isinstance(table_meta["schema"], dict):
+            for i in range(len(tables)):
+                if tables[i].name == table_name:
+                    tables[i] = tables[i].copy()
+                    tables[i].options.update(table_options)
+            return
+        for i in range(len(tables)):
+            if tables[i].name == table_name:
+                table = tables[i] = tables[i].copy(schema={})
+                table.options.update(table_options)
+                get_logger().info("load database update table %s %s %s", database_name, table_name, filename)
+                break
+        else:
+            table = Table(table_name, None, {}, options=table_options)
+            tables.append(table)
+            get_logger().info("load database append table %s %s %s", database_name, table_name, filename)
+        for column_name, column_type in table_meta["schema"].items():
+            if not column_type or not isinstance(column_type, str):
+                table.schema[column_name] = (ColumnType.VARCHAR, None)
+                continue
+            column_type = column_type.lower()
+            if column_type in cls.COLUMN_TYPES:
+                table.schema[column_name] = (cls.COLUMN_TYPES[column_type], Compiler.TYPE_FILTERS.get(column_type))
+            else:
+                try:
+                    filter_cls = find_filter(column_type)
+                    if filter_cls:
+                        table.schema[column_name] = (filter_cls.SqlColumnType
+                                                     if hasattr(filter_cls, "SqlColumnType")
+                                                     else ColumnType.VARCHAR, column_type)
+                except:
+                    table.schema[column_name] = (ColumnType.VARCHAR, None)
+
+
+class CatalogScanner(object):
+    MANIFEST_VERSION = 1
+
+    def __init__(self, config_path, script_engine, catalog, is_scan_database, table_script_cache=None,
+                 scan_manifest=None):
+        self.config_path = config_path
+        self.script_engine = script_engine
+        self.catalog = catalog
+        self.is_scan_database = is_scan_database
+        self.table_script_cache = table_script_cache
+        self.scan_manifest = scan_manifest
+        self.lock = threading.Lock()
+        self.schema_databases = {}
+        self.sql_files = {}
+        self.meta_files = {}
+        self.config_hash = self.get_config_hash()
+        self.manifest_files = self.load_manifest()
+
+    def get_version(self, filename):
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_content_hash(self, filename):
+        with open(filename, "rb") as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+
+    def get_config_hash(self):
+        try:
+            config = json.dumps(self.script_engine.config.get(), ensure_ascii=False, sort_keys=True, default=str)
+        except Exception:
+            return None
+        return hashlib.sha1(config.encode("utf-8")).hexdigest()
+
+    def load_manifest(self):
+        if not self.scan_manifest or not os.path.exists(self.scan_manifest):
+            return {}
+        try:
+            with open(self.scan_manifest, "r", encoding="utf-8") as fp:
+                manifest = json.load(fp)
+            if not isinstance(manifest, dict) or manifest.get("version") != self.MANIFEST_VERSION \
+                    or manifest.get("syncanysql_version") != syncanysql_version \
+                    or not self.config_hash or manifest.get("config_hash") != self.config_hash:
+                get_logger().info("load database scan manifest outdated %s", self.scan_manifest)
+                return {}
+            return manifest.get("files") or {}
+        except Exception as e:
+            get_logger().warning("load database scan manifest error %s %s", self.scan_manifest, str(e))
+        return {}
+
+    def save_manifest(self):
+        try:
+            manifest_filename = "%s.%d.tmp" % (self.scan_manifest, os.getpid())
+            with open(manifest_filename, "w", encoding="utf-8") as fp:
+                json.dump({"version": self.MANIFEST_VERSION, "syncanysql_version": syncanysql_version,
+                           "config_hash": self.config_hash, "files": self.manifest_files}, fp, ensure_ascii=False)
+            os.replace(manifest_filename, self.scan_manifest)
+        except Exception as e:
+            get_logger().warning("save database scan manifest error %s %s", self.scan_manifest, str(e))
+
+    def load_sql_file(self, database_name, table_name, filename, is_flush=False):
+        try:
+            content_hash = self.get_content_hash(filename)
+        except OSError as e:
+            get_logger().warning("load database file error %s %s", filename, str(e))
+            return [], None
+        manifest_file = self.manifest_files.get(filename) if not is_flush else None
+        if manifest_file and manifest_file.get("hash") == content_hash:
+            get_logger().info("load database sql file manifest %s %s", database_name, filename)
+            return [Table(name, filename, {column_name: (ColumnType(column_type), filter_name)
+                                           for column_name, column_type, filter_name in schema}, primary_keys)
+                    for name, schema, primary_keys in manifest_file["tables"]], None
+        try:
+            tables = Database.load_sql_tables(database_name, table_name, filename, self.script_engine,
+                                              self.table_script_cache)
+        except Exception as e:
+            get_logger().warning("load database file error %s %s", filename, str(e))
+            return [], None
+        return tables, {"hash": content_hash, "tables": [
+            [table.name, [[column_name, int(column_type[0]), column_type[1]]
+                          for column_name, column_type in table.schema.items()], table.primary_keys]
+            for table in tables]}
+
+    def load_schema_databases(self):
+        schema_databases = {}
+        if self.is_scan_database:
             from .schema import load_database_schemas
-            load_database_schemas(script_engine, new_databases)
-        for dirname in ([config_path] + list(os.listdir(config_path))):
-            dirpath = config_path if dirname == config_path else os.path.join(config_path, dirname)
+            load_database_schemas(self.script_engine, schema_databases)
+        return schema_databases
+
+    def list_dirs(self):
+        dirpaths = []
+        for dirname in ([self.config_path] + list(os.listdir(self.config_path))):
+            dirpath = self.config_path if dirname == self.config_path else os.path.join(self.config_path, dirname)
             if not os.path.isdir(dirpath):
                 continue
-            get_logger().info("load database scan dir %s", dirpath)
-            database_name = os.path.basename(config_path) if dirname == config_path else dirname
+            database_name = os.path.basename(self.config_path) if dirname == self.config_path else dirname
             if not database_name.isidentifier():
                 database_name = "".join([c if c.isidentifier() else "_" for c in database_name])
 
@@ -115,86 +535,131 @@ class Database(object):
                     sql_filenames.append((table_name, os.path.join(dirpath, filename)))
                 elif fileext in (".json", ".yaml") and table_name.endswith(".meta"):
                     meta_filenames.append((table_name[:-5], os.path.join(dirpath, filename)))
+            dirpaths.append((database_name, dirpath, sql_filenames, meta_filenames))
+        return dirpaths
 
-            tables = []
-            for table_name, filename in sql_filenames:
-                try:
-                    get_logger().info("load database sql file parse %s %s", database_name, filename)
-                    sql_parser = FileParser(filename)
-                    sqls = sql_parser.load()
-                    executor = Executor(script_engine.manager, script_engine.executor.session_config.session(),
-                                        script_engine.executor)
-                    executor.run("scan", sqls)
-                    if not executor.runners:
-                        continue
-                    for tasker in executor.runners:
+    def scan(self, is_full=True, is_flush=False):
+        with self.lock:
+            if is_full:
+                self.sql_files, self.meta_files = {}, {}
+            dirpaths = self.list_dirs()
+            sql_files, meta_files, load_futures = {}, {}, {}
+            with ThreadPoolExecutor(thread_name_prefix="syncany-scan") as thread_pool_executor:
+                schema_future = thread_pool_executor.submit(self.load_schema_databases) if is_full else None
+                for database_name, dirpath, sql_filenames, _ in dirpaths:
+                    if is_full:
+                        get_logger().info("load database scan dir %s", dirpath)
+                    for table_name, filename in sql_filenames:
                         try:
-                            if not isinstance(tasker, QueryTasker):
-                                continue
-                            if ("&.--." + table_name) in tasker.config["output"]:
-                                output_info = tasker.config["output"].split("&.--.")[-1].split("::")
-                                table_name = output_info[0]
-                                primary_keys = output_info[1].split(" ")[0].split("+") if len(output_info) >= 2 else None
-                                tables.append(Table(table_name, filename, Table.parse_schema(tasker), primary_keys))
-                                get_logger().info("load database append table %s %s %s", database_name, table_name, filename)
-                            elif tasker.reduce_config and ("&.--." + table_name) in tasker.reduce_config["output"]:
-                                output_info = tasker.reduce_config["output"].split("&.--.")[-1].split("::")
-                                table_name = output_info[0]
-                                primary_keys = output_info[1].split(" ")[0].split("+") if len(output_info) >= 2 else None
-                                tables.append(Table(table_name, filename, Table.parse_schema(tasker), primary_keys))
-                                get_logger().info("load database append table %s %s %s", database_name, table_name, filename)
-                            else:
-                                get_logger().warning("load database file no output table memory db %s %s %s", database_name, table_name, filename)
-                        finally:
-                            tasker.tasker.close()
-                except Exception as e:
-                    get_logger().warning("load database file error %s %s", filename, str(e))
-
-            for table_name, filename in meta_filenames:
-                try:
-                    get_logger().info("load database meta file parse %s %s", database_name, filename)
-                    table_meta = load_config(filename)
-                    if not isinstance(table_meta, dict) or "schema" not in table_meta or not isinstance(table_meta["schema"], dict):
+                            version = self.get_version(filename)
+                        except OSError:
+                            continue
+                        sql_file = self.sql_files.get(filename)
+                        if sql_file is not None and sql_file[0] == version:
+                            sql_files[filename] = sql_file
+                            continue
+                        load_futures[filename] = (version, thread_pool_executor.submit(self.load_sql_file, database_name,
+                                                                                       table_name, filename, is_flush))
+                is_manifest_changed = False
+                for filename, (version, load_future) in load_futures.items():
+                    tables, manifest_file = load_future.result()
+                    sql_files[filename] = (version, tables)
+                    if manifest_file is not None:
+                        self.manifest_files[filename] = manifest_file
+                        is_manifest_changed = True
+                if schema_future is not None:
+                    self.schema_databases = schema_future.result()
+            changed_count = len(load_futures)
+
+            new_databases = dict(self.schema_databases)
+            for database_name, dirpath, sql_filenames, meta_filenames in dirpaths:
+                tables = []
+                for table_name, filename in sql_filenames:
+                    if filename in sql_files:
+                        tables.extend(sql_files[filename][1])
+
+                for table_name, filename in meta_filenames:
+                    try:
+                        version = self.get_version(filename)
+                    except OSError:
+                        continue
+                    meta_file = self.meta_files.get(filename)
+                    if meta_file is None or meta_file[0] != version:
+                        meta_file = (version, Database.load_table_meta(database_name, filename))
+                        changed_count += 1
+                    meta_files[filename] = meta_file
+                    if meta_file[1] is None:
                         continue
                     try:
-                        table = [t for t in tables if t.name == table_name][0]
-                        table.schema.clear()
-                        get_logger().info("load database update table %s %s %s", database_name, table_name, filename)
-                    except:
-                        table = Table(table_name, None, {})
-                        tables.append(table)
-                        get_logger().info("load database append table %s %s %s", database_name, table_name, filename)
-                    for column_name, column_type in table_meta["schema"].items():
-                        if not column_type or not isinstance(column_type, str):
-                            table.schema[column_name] = (ColumnType.VARCHAR, None)
+                        Database.apply_table_meta(database_name, table_name, meta_file[1], tables, filename)
+                    except Exception as e:
+                        get_logger().warning("load meta file error %s %s", filename, str(e))
+                if not tables:
+                    continue
+                if database_name in new_databases:
+                    merge_tables = list(new_databases[database_name].tables)
+                    load_tables = {merge_tables[i].name: i for i in range(len(merge_tables))}
+                    for table in tables:
+                        if table.name in load_tables:
+                            merge_tables[load_tables[table.name]] = table
                             continue
-                        column_type = column_type.lower()
-                        if column_type in cls.COLUMN_TYPES:
-                            table.schema[column_name] = (cls.COLUMN_TYPES[column_type], Compiler.TYPE_FILTERS.get(column_type))
-                        else:
-                            try:
-                                filter_cls = find_filter(column_type)
-                                if filter_cls:
-                                    table.schema[column_name] = (filter_cls.SqlColumnType
-                                                                 if hasattr(filter_cls, "SqlColumnType")
-                                                                 else ColumnType.VARCHAR, column_type)
-                            except:
-                                table.schema[column_name] = (ColumnType.VARCHAR, None)
-                except Exception as e:
-                    get_logger().warning("load meta file error %s %s", filename, str(e))
-            if not tables:
-                continue
-            if database_name in new_databases:
-                load_tables = {new_databases[database_name].tables[i].name: i for i in range(len(new_databases[database_name].tables))}
-                for table in tables:
-                    if table.name in load_tables:
-                        new_databases[database_name].tables[load_tables[table.name]] = table
-                        continue
-                    new_databases[database_name].tables.append(table)
-            else:
-                new_databases[database_name] = Database(database_name, tables)
-        databases.clear()
-        databases.update(new_databases)
-        get_logger().info("scan databases finish, find databases: %s", ",".join(list(databases.keys())))
+                        merge_tables.append(table)
+                    new_databases[database_name] = Database(database_name, merge_tables)
+                else:
+                    new_databases[database_name] = Database(database_name, tables)
+
+            changed_count += len(set(self.sql_files) - set(sql_files)) + len(set(self.meta_files) - set(meta_files))
+            self.sql_files, self.meta_files = sql_files, meta_files
+            for filename in set(self.manifest_files) - set(sql_files):
+                self.manifest_files.pop(filename, None)
+                is_manifest_changed = True
+            if is_manifest_changed and self.scan_manifest:
+                self.save_manifest()
+            if not is_full and not changed_count:
+                return None
+            catalog_snapshot = self.catalog.swap(new_databases)
+            get_logger().info("scan databases finish, catalog version %d, %d files changed, find databases: %s",
+                              catalog_snapshot.version, changed_count, ",".join(list(catalog_snapshot.databases.keys())))
+            return catalog_snapshot
+
+
+class CatalogSnapshot(object):
+    def __init__(self, version, databases):
+        self.version = version
+        self.databases = databases
+
+    def get_database(self, database_name):
+        return self.databases.get(database_name)
+
+    def get_table(self, database_name, table_name):
+        database = self.databases.get(database_name)
+        if database is None:
+            return None
+        return database.get_table(table_name)
+
+    def get_table_schema(self, database_name, table_name):
+        database = self.databases.get(database_name)
+        if database is None:
+            return None
+        return database.get_table_schema(table_name)
+
+    def get_stats(self):
+        return {"version": self.version, "databases": len(self.databases),
+                "tables": sum(len(database.tables) for database in self.databases.values())}
+
+
+class Catalog(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = CatalogSnapshot(0, {})
+        self.scanner = None
+
+    def current(self):
+        return self.snapshot
+
+    def swap(self, databases):
+        with self.lock:
+            self.snapshot = CatalogSnapshot(self.snapshot.version + 1, dict(databases))
+            return self.snapshot
 
 
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import decimal
+import json
+import datetime
+from mysql_mimic.results import ResultColumn, infer_type
+
+SQL_COMMON_TYPES = (bool, int, float, str, bytes, datetime.date, datetime.time, decimal.Decimal)
+SQL_COMPLICACY_TYPES = (set, dict, list, tuple)
+
+TYPE_PYTHON_TYPES = {
+    "int": int, "float": float, "str": str, "bytes": bytes, "bool": bool, "decimal": decimal.Decimal,
+    "datetime": datetime.datetime, "date": datetime.date, "time": datetime.time,
+}
+TYPE_COLUMN_TYPES = {
+    "int": infer_type(0), "float": infer_type(0.0), "str": infer_type(""), "bytes": infer_type(b""),
+    "bool": infer_type(False), "decimal": infer_type(decimal.Decimal(0)),
+    "datetime": infer_type(datetime.datetime(1970, 1, 1)), "date": infer_type(datetime.date(1970, 1, 1)),
+    "time": infer_type(datetime.time()),
+}
+
+
+def format_value(value):
+    if value is None:
+        return value
+    if isinstance(value, datetime.datetime):
+        return datetime.datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
+    if isinstance(value, SQL_COMMON_TYPES):
+        return value
+    if isinstance(value, SQL_COMPLICACY_TYPES):
+        return json.dumps(value, default=str, ensure_ascii=False)
+    return str(value)
+
+
+def encode_values(values):
+    return [format_value(value) for value in values]
+
+
+def build_typed_encoder(python_type):
+    def encode_typed_values(values):
+        return [value if value is None or value.__class__ is python_type else format_value(value)
+                for value in values]
+    return encode_typed_values
+
+
+def encode_datetime_values(values):
+    datetime_type = datetime.datetime
+    return [value if value is None else (datetime_type(value.year, value.month, value.day, value.hour,
+                                                       value.minute, value.second)
+                                         if value.__class__ is datetime_type else format_value(value))
+            for value in values]
+
+
+class ResultEncoder(object):
+    def __init__(self, keys, schema=None):
+        self.keys = keys
+        self.python_types = []
+        self.column_types = []
+        self.encoders = []
+        for key in keys:
+            column = schema.get(key) if schema else None
+            type_name = column[1] if column and len(column) >= 2 else None
+            if type_name in TYPE_PYTHON_TYPES:
+                self.python_types.append(TYPE_PYTHON_TYPES[type_name])
+                self.column_types.append(TYPE_COLUMN_TYPES[type_name])
+                self.encoders.append(encode_datetime_values if type_name == "datetime"
+                                     else build_typed_encoder(TYPE_PYTHON_TYPES[type_name]))
+            else:
+                self.python_types.append(None)
+                self.column_types.append(None)
+                self.encoders.append(encode_values)
+        self.columns = None
+
+    def encode(self, datas):
+        if not self.keys:
+            rows = [() for _ in datas]
+        else:
+            rows = list(zip(*(encoder([data[key] for data in datas])
+                              for key, encoder in zip(self.keys, self.encoders))))
+        if self.columns is None:
+            self.columns = self.build_columns(rows)
+        return rows
+
+    def build_columns(self, rows):
+        columns = []
+        for i in range(len(self.keys)):
+            value = None
+            for row in rows:
+                if row[i] is not None:
+                    value = row[i]
+                    break
+            python_type = self.python_types[i]
+            if python_type is not None and (value is None or isinstance(value, python_type)):
+                columns.append(ResultColumn(name=self.keys[i], type=self.column_types[i]))
+            else:
+                columns.append(ResultColumn(name=self.keys[i], type=infer_type(value)))
+        return columns
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import threading
+from mysql_mimic.errors import MysqlError
+from syncany.logger import get_logger
+from syncanysql import Executor
+
+ER_QUERY_INTERRUPTED = 1317
+ER_QUERY_TIMEOUT = 3024
+ER_NO_SUCH_THREAD = 1094
+ER_KILL_DENIED_ERROR = 1095
+
+
+class QueryInterrupted(MysqlError):
+    def __init__(self, reason="killed"):
+        if reason == "timeout":
+            super(QueryInterrupted, self).__init__("Query execution was interrupted, maximum statement execution "
+                                                   "time exceeded", ER_QUERY_TIMEOUT)
+        elif reason == "memory":
+            super(QueryInterrupted, self).__init__("Query execution was interrupted, maximum query memory exceeded",
+                                                   ER_QUERY_INTERRUPTED)
+        else:
+            super(QueryInterrupted, self).__init__("Query execution was interrupted", ER_QUERY_INTERRUPTED)
+        self.reason = reason
+
+    def __reduce__(self):
+        return self.__class__, (self.reason,)
+
+
+class QueryCanceller(object):
+    def __init__(self, timeout=0):
+        self.timeout = timeout
+        self.cancelled = False
+        self.reason = None
+        self.executors = set()
+        self.lock = threading.Lock()
+        self.timer = None
+        if timeout and timeout > 0:
+            self.timer = threading.Timer(timeout, self.cancel, ("timeout",))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def cancel(self, reason="killed"):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            executors = list(self.executors)
+        get_logger().info("query cancelled by %s, terminate %d executors", reason, len(executors))
+        for executor in executors:
+            try:
+                executor.terminate()
+            except Exception as e:
+                get_logger().warning("query cancel terminate executor error: %s", e)
+
+    def check(self):
+        if self.cancelled:
+            raise QueryInterrupted(self.reason)
+
+    def register(self, executor):
+        with self.lock:
+            self.executors.add(executor)
+        if self.cancelled:
+            executor.terminate()
+
+    def unregister(self, executor):
+        with self.lock:
+            self.executors.discard(executor)
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+class CancellableExecutor(Executor):
+    def __init__(self, manager, session_config, parent_executor=None, canceller=None):
+        super(CancellableExecutor, self).__init__(manager, session_config, parent_executor)
+
+        self.canceller = canceller if canceller is not None else getattr(parent_executor, "canceller", None)
+        self.projection = None
+
+    def execute(self):
+        if self.canceller is None:
+            return super(CancellableExecutor, self).execute()
+
+        self._thread_local.current_executor = self
+        self.canceller.register(self)
+        try:
+            while self.runners:
+                self.canceller.check()
+                self.tasker = self.runners.popleft()
+                try:
+                    self.tasker.run(self, self.session_config, self.manager)
+                except Exception:
+                    self.canceller.check()
+                    raise
+                finally:
+                    self.tasker = None
+            self.canceller.check()
+        except QueryInterrupted:
+            self.close_runners()
+            raise
+        finally:
+            self.canceller.unregister(self)
+
+    def close_runners(self):
+        while self.runners:
+            runner = self.runners.popleft()
+            tasker = getattr(runner, "tasker", None)
+            if tasker is None or not callable(getattr(tasker, "close", None)):
+                continue
+            try:
+                tasker.close(False, "query interrupted")
+            except Exception as e:
+                get_logger().warning("query interrupted close tasker error: %s", e)
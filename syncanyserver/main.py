@@ -7,7 +7,9 @@ import argparse
 import asyncio
 import signal
 import sys
+from syncanysql.config import GlobalConfig
 from .server import Server
+from .supervisor import WorkerSupervisor
 
 
 def check_path(value):
@@ -46,22 +48,71 @@ def main():
     parser.add_argument('-W', "--writable", dest='writable_execute', nargs='?',
                         const=True, default=False, type=bool,
                         help='is writable sql can execute (default: False)')
+    parser.add_argument('-R', "--result_cache_size", dest='result_cache_size', default=256, type=int,
+                        help='Maximum memory size in MB of the virtual table result cache, tables are only cached '
+                             'when cache_ttl is configured in the meta file, 0 disables it (default: 256)')
+    parser.add_argument('-B', "--streaming_batch", dest='streaming_batch', default=0, type=int,
+                        help='Stream query results to the client in batches of this many rows instead of '
+                             'materializing the whole result set, can be changed per session with '
+                             'SET streaming_batch, 0 disables it (default: 0)')
+    parser.add_argument('-M', "--executor_mode", dest='executor_mode', default="thread", choices=("thread", "process"),
+                        help='Execute select queries in a ThreadPoolExecutor or in a ProcessPoolExecutor of '
+                             'executor_max_workers worker processes so CPU-bound queries can use multiple cores '
+                             '(default: thread)')
+    parser.add_argument('-m', "--metrics_port", dest='metrics_port', default=0, type=int,
+                        help='Serve Prometheus text format metrics over HTTP on 127.0.0.1 at this port, '
+                             '0 disables it (default: 0)')
+    parser.add_argument('-r', "--reload_interval", dest='reload_interval', default=0, type=int,
+                        help='Watch the configuration directory and reload only changed table scripts, meta files '
+                             'and user config in the background, using inotify where available and polling file '
+                             'modification times every this many seconds otherwise, 0 disables it (default: 0)')
+    parser.add_argument('-s', "--scan_manifest", dest='scan_manifest', default="", type=str,
+                        help='File caching the tables compiled from each table script by content hash, so a restart '
+                             'only recompiles changed scripts, relative paths are resolved from the configuration '
+                             'directory, empty disables it (default: disabled)')
+    parser.add_argument('-L', "--memory_limit", dest='memory_limit', default=0, type=int,
+                        help='Global memory budget in MB for buffered query results, once exceeded results are '
+                             'spilled to temporary files and streamed back to the client, a per query budget can '
+                             'be set with SET query_memory_limit, 0 disables it (default: 0)')
+    parser.add_argument('-n', "--workers", dest='workers', default=0, type=int,
+                        help='Fork this many worker processes sharing the bind port with SO_REUSEPORT under a '
+                             'supervisor that restarts crashed workers, reloads them one by one on SIGHUP and serves '
+                             'their merged metrics, 0 runs a single server process (default: 0)')
+    parser.add_argument('-D', "--spill_path", dest='spill_path', default=None, type=str,
+                        help='Directory of the temporary files results are spilled to (default: system temp dir)')
     args = parser.parse_args()
+    if args.workers > 0 and sys.platform == "win32":
+        parser.error("--workers is not supported on windows")
     if args.config_path:
         os.chdir(os.path.abspath(args.config_path))
         if args.config_path not in sys.path:
             sys.path.insert(0, args.config_path)
 
-    async def serve_forever():
+    async def serve_forever(metrics_path=None, ready=None):
         server = Server(args.bind, args.port, os.path.abspath(args.config_path),
                args.username, args.password,
                args.executor_max_workers, args.executor_wait_timeout,
-               args.is_scan_database, False if args.writable_execute else True)
+               args.is_scan_database, False if args.writable_execute else True,
+               args.result_cache_size, args.streaming_batch, args.executor_mode,
+               0 if metrics_path else args.metrics_port, args.reload_interval,
+               os.path.join(os.path.abspath(args.config_path), args.scan_manifest) if args.scan_manifest else None,
+               args.memory_limit, os.path.abspath(args.spill_path) if args.spill_path else None, metrics_path)
+        await server.start_server()
         if sys.platform != "win32":
             loop = asyncio.get_running_loop()
             loop.add_signal_handler(signal.SIGHUP, lambda s: loop.call_later(0, lambda: server.close()), signal.SIGHUP)
             loop.add_signal_handler(signal.SIGTERM, lambda s: loop.call_later(0, lambda: server.close()), signal.SIGTERM)
+        if ready:
+            ready()
         await server.serve_forever()
+
+    if args.workers > 0:
+        config = GlobalConfig()
+        config.load()
+        config.config_logging()
+        WorkerSupervisor(args.workers, lambda index, metrics_path, ready: asyncio.run(serve_forever(
+            metrics_path if args.metrics_port else None, ready)), args.metrics_port).run()
+        return
     asyncio.run(serve_forever())
 
 
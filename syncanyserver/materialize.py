@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import os
+import time
+import datetime
+import threading
+from syncany.logger import get_logger
+from .columnar import compact_datas
+
+CRON_FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def parse_cron_field(field, min_value, max_value):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+            if step <= 0:
+                raise ValueError("cron step error: %s" % field)
+        if part == "*":
+            start, end = min_value, max_value
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = max_value if step > 1 else start
+        if start < min_value or end > max_value or start > end:
+            raise ValueError("cron value out of range: %s" % field)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class IntervalSchedule(object):
+    def __init__(self, interval):
+        if interval <= 0:
+            raise ValueError("materialized interval must be greater than 0")
+        self.interval = interval
+
+    def next_time(self, now):
+        return now + self.interval
+
+
+class CronSchedule(object):
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("cron expression must have 5 fields: %s" % expression)
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_cron_field(fields[i], *CRON_FIELD_RANGES[i]) for i in range(5))
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+        self.is_any_day = fields[2] == "*"
+        self.is_any_weekday = fields[4] == "*"
+
+    def is_day_matched(self, dt):
+        is_day, is_weekday = dt.day in self.days, (dt.weekday() + 1) % 7 in self.weekdays
+        if self.is_any_day or self.is_any_weekday:
+            return is_day and is_weekday
+        return is_day or is_weekday
+
+    def next_time(self, now):
+        dt = datetime.datetime.fromtimestamp(now).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        end_dt = dt + datetime.timedelta(days=366 * 5)
+        while dt < end_dt:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self.is_day_matched(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt = dt + datetime.timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError("cron expression never matched: %s" % self.expression)
+
+
+def parse_schedule(value):
+    if isinstance(value, bool) or value is None:
+        raise ValueError("materialized schedule error: %r" % value)
+    if isinstance(value, (int, float)):
+        return IntervalSchedule(value)
+    value = str(value).strip()
+    try:
+        return IntervalSchedule(float(value))
+    except ValueError:
+        return CronSchedule(value)
+
+
+def get_table_version(table):
+    try:
+        stat = os.stat(table.filename)
+    except OSError:
+        return table.filename, None, table.options
+    return table.filename, (stat.st_mtime_ns, stat.st_size), table.options
+
+
+def get_merge_keys(table):
+    merge_keys = table.options.get("primary_keys") or table.primary_keys
+    if isinstance(merge_keys, str):
+        merge_keys = [merge_keys]
+    if not merge_keys or "-" in merge_keys:
+        return None
+    if table.schema and any(key not in table.schema for key in merge_keys):
+        return None
+    return list(merge_keys)
+
+
+def get_watermark(datas, column, watermark=None):
+    try:
+        for data in datas:
+            value = data.get(column)
+            if value is not None and (watermark is None or value > watermark):
+                watermark = value
+    except TypeError:
+        return None
+    return watermark
+
+
+def merge_datas(datas, delta_datas, keys):
+    datas = list(datas)
+    indexes = {tuple(data.get(key) for key in keys): i for i, data in enumerate(datas)}
+    for data in delta_datas:
+        data_key = tuple(data.get(key) for key in keys)
+        index = indexes.get(data_key)
+        if index is None:
+            indexes[data_key] = len(datas)
+            datas.append(data)
+        else:
+            datas[index] = data
+    return datas
+
+
+class MaterializedSnapshot(object):
+    def __init__(self, table, datas, refreshed_time, refresh_duration, watermark=None, version=None):
+        self.table = table
+        self.datas = datas
+        self.refreshed_time = refreshed_time
+        self.refresh_duration = refresh_duration
+        self.watermark = watermark
+        self.version = version
+
+
+class MaterializedStore(object):
+    def __init__(self):
+        self.snapshots = {}
+        self.lock = threading.Lock()
+
+    def get(self, database_name, table_name):
+        with self.lock:
+            return self.snapshots.get((database_name, table_name))
+
+    def set(self, database_name, table_name, snapshot):
+        with self.lock:
+            self.snapshots[(database_name, table_name)] = snapshot
+
+    def remove(self, database_name, table_name):
+        with self.lock:
+            self.snapshots.pop((database_name, table_name), None)
+
+    def keys(self):
+        with self.lock:
+            return list(self.snapshots.keys())
+
+    def get_stats(self):
+        now = time.time()
+        with self.lock:
+            return {key: {"rows": len(snapshot.datas), "age": now - snapshot.refreshed_time,
+                          "refresh_duration": snapshot.refresh_duration}
+                    for key, snapshot in self.snapshots.items()}
+
+
+class MaterializedRefresher(object):
+    def __init__(self, catalog, store, refresh, metrics=None):
+        self.catalog = catalog
+        self.store = store
+        self.refresh = refresh
+        self.metrics = metrics
+        self.catalog_version = None
+        self.schedules = {}
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.update()
+        self.thread = threading.Thread(target=self.run, name="syncany-materialized-refresher", daemon=True)
+        self.thread.start()
+
+    def update(self):
+        catalog_snapshot = self.catalog.current()
+        if catalog_snapshot.version == self.catalog_version:
+            return
+        schedules = {}
+        for database in catalog_snapshot.databases.values():
+            for table in database.tables:
+                if not table.filename or not table.options.get("materialized"):
+                    continue
+                key = (database.name, table.name)
+                if key in schedules:
+                    continue
+                schedule, version = self.schedules.get(key), get_table_version(table)
+                if schedule is not None and schedule[3] == version:
+                    schedule[1] = table
+                    schedules[key] = schedule
+                    continue
+                try:
+                    schedules[key] = [parse_schedule(table.options["materialized"]), table, 0, version]
+                except ValueError as e:
+                    get_logger().warning("materialized table %s.%s schedule error: %s", database.name, table.name, e)
+        for key in self.store.keys():
+            if key not in schedules:
+                self.store.remove(*key)
+        self.schedules, self.catalog_version = schedules, catalog_snapshot.version
+        if schedules:
+            get_logger().info("materialized tables %s", ", ".join("%s.%s" % key for key in sorted(schedules)))
+
+    def refresh_table(self, database_name, table):
+        start_time = time.time()
+        snapshot = self.store.get(database_name, table.name)
+        version = get_table_version(table)
+        watermark_column = table.options.get("watermark")
+        merge_keys = get_merge_keys(table) if watermark_column else None
+        if watermark_column and not merge_keys:
+            get_logger().warning("materialized table %s.%s watermark without primary keys, full refreshing",
+                                 database_name, table.name)
+        is_incremental = merge_keys is not None and snapshot is not None and snapshot.version == version \
+                         and snapshot.watermark is not None
+        try:
+            if is_incremental:
+                variable_name = "@%s__gte" % (table.options.get("watermark_variable") or watermark_column)
+                datas = list(self.refresh(database_name, table, {variable_name: snapshot.watermark}) or [])
+                merged_datas = merge_datas(snapshot.datas, datas, merge_keys)
+            else:
+                datas = list(self.refresh(database_name, table) or [])
+                merged_datas = datas
+        except Exception as e:
+            get_logger().warning("materialized table %s.%s refresh error: %s", database_name, table.name, e)
+            if self.metrics is not None:
+                self.metrics.observe_materialized(database_name, table.name, "error", time.time() - start_time, 0)
+            return False
+        if table.options.get("columnar"):
+            merged_datas = compact_datas(merged_datas)
+        refresh_duration = time.time() - start_time
+        watermark = get_watermark(datas, watermark_column, snapshot.watermark if is_incremental else None) \
+            if merge_keys else None
+        self.store.set(database_name, table.name, MaterializedSnapshot(table, merged_datas, time.time(),
+                                                                       refresh_duration, watermark, version))
+        if self.metrics is not None:
+            self.metrics.observe_materialized(database_name, table.name, "success", refresh_duration, len(datas))
+        get_logger().info("materialized table %s.%s %s refreshed %d rows %.3fms", database_name, table.name,
+                          "incremental" if is_incremental else "full", len(datas), refresh_duration * 1000)
+        return True
+
+    def run(self):
+        while not self.closed:
+            try:
+                self.update()
+                now = time.time()
+                for (database_name, _), schedule in list(self.schedules.items()):
+                    if self.closed or schedule[2] > now:
+                        continue
+                    self.refresh_table(database_name, schedule[1])
+                    schedule[2] = schedule[0].next_time(time.time())
+                wait_timeout = min([schedule[2] for schedule in self.schedules.values()] or [now + 1]) - time.time()
+            except Exception as e:
+                get_logger().warning("materialized refresher error: %s", e)
+                wait_timeout = 1
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(min(max(wait_timeout, 0.01), 1))
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
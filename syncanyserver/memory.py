@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import threading
+from mysql_mimic.errors import MysqlError
+from syncany.database.memory import MemoryDBCollection
+from .cache import get_datas_size
+
+ER_CAPACITY_EXCEEDED = 3170
+
+
+class CopyOnWriteDatas(list):
+    origin_datas = None
+
+    def __init__(self, datas):
+        super(CopyOnWriteDatas, self).__init__()
+
+        self.origin_datas = datas
+
+    def materialize(self):
+        if self.origin_datas is None:
+            return
+        origin_datas, self.origin_datas = self.origin_datas, None
+        list.extend(self, origin_datas)
+
+    def __len__(self):
+        if self.origin_datas is not None:
+            return len(self.origin_datas)
+        return list.__len__(self)
+
+    def __iter__(self):
+        if self.origin_datas is not None:
+            return iter(self.origin_datas)
+        return list.__iter__(self)
+
+    def __reversed__(self):
+        if self.origin_datas is not None:
+            return reversed(self.origin_datas)
+        return list.__reversed__(self)
+
+    def __getitem__(self, index):
+        if self.origin_datas is not None:
+            return self.origin_datas[index]
+        return list.__getitem__(self, index)
+
+    def __contains__(self, data):
+        if self.origin_datas is not None:
+            return data in self.origin_datas
+        return list.__contains__(self, data)
+
+    def __eq__(self, other):
+        if self.origin_datas is not None:
+            return self.origin_datas == other
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        if self.origin_datas is not None:
+            return repr(self.origin_datas)
+        return list.__repr__(self)
+
+    def index(self, *args):
+        if self.origin_datas is not None:
+            return self.origin_datas.index(*args)
+        return list.index(self, *args)
+
+    def count(self, data):
+        if self.origin_datas is not None:
+            return self.origin_datas.count(data)
+        return list.count(self, data)
+
+    def copy(self):
+        return self[:]
+
+    def __setitem__(self, index, data):
+        self.materialize()
+        return list.__setitem__(self, index, data)
+
+    def __delitem__(self, index):
+        self.materialize()
+        return list.__delitem__(self, index)
+
+    def __iadd__(self, datas):
+        self.materialize()
+        return list.__iadd__(self, datas)
+
+    def __imul__(self, n):
+        self.materialize()
+        return list.__imul__(self, n)
+
+    def append(self, data):
+        self.materialize()
+        return list.append(self, data)
+
+    def extend(self, datas):
+        self.materialize()
+        return list.extend(self, datas)
+
+    def insert(self, index, data):
+        self.materialize()
+        return list.insert(self, index, data)
+
+    def pop(self, *args):
+        self.materialize()
+        return list.pop(self, *args)
+
+    def remove(self, data):
+        self.materialize()
+        return list.remove(self, data)
+
+    def clear(self):
+        self.origin_datas = None
+        return list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self.materialize()
+        return list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self.materialize()
+        return list.reverse(self)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    __hash__ = None
+
+
+class LayeredMemoryDBCollection(MemoryDBCollection):
+    def __init__(self, parent=None):
+        super(LayeredMemoryDBCollection, self).__init__()
+
+        self.parent = parent
+        self.removed = set()
+
+    def __getitem__(self, name):
+        if dict.__contains__(self, name):
+            return dict.__getitem__(self, name)
+        if self.parent is None or name in self.removed:
+            raise KeyError(name)
+        datas = self.parent[name]
+        if isinstance(datas, list):
+            datas = CopyOnWriteDatas(datas)
+            dict.__setitem__(self, name, datas)
+        return datas
+
+    def __setitem__(self, name, datas):
+        self.removed.discard(name)
+        dict.__setitem__(self, name, datas)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.remove(name)
+
+    def __contains__(self, name):
+        if dict.__contains__(self, name):
+            return True
+        return self.parent is not None and name not in self.removed and name in self.parent
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        if self.parent is None:
+            return dict.__len__(self)
+        return len(self.keys())
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def pop(self, name, *args):
+        try:
+            datas = self[name]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        dict.pop(self, name, None)
+        if self.parent is not None and name in self.parent:
+            self.removed.add(name)
+        return datas
+
+    def remove(self, name):
+        self.pop(name, None)
+
+    def keys(self):
+        keys = list(dict.keys(self))
+        if self.parent is not None:
+            local_keys = set(keys)
+            keys.extend(name for name in self.parent.keys() if name not in local_keys and name not in self.removed)
+        return keys
+
+    def values(self):
+        return [self[name] for name in self.keys()]
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def update(self, *args, **kwargs):
+        for name, datas in dict(*args, **kwargs).items():
+            self[name] = datas
+
+    def clear(self):
+        dict.clear(self)
+        self.removed = set(self.parent.keys()) if self.parent is not None else set()
+
+
+def get_collection_size(collection, exclude_names=None):
+    size = 0
+    for name, datas in list(dict.items(collection)):
+        if exclude_names and name in exclude_names:
+            continue
+        if isinstance(datas, CopyOnWriteDatas) and datas.origin_datas is not None:
+            continue
+        try:
+            size += datas.get_size() if hasattr(datas, "get_size") else get_datas_size(datas)
+        except Exception:
+            continue
+    return size
+
+
+class MemoryLimitExceeded(MysqlError):
+    def __init__(self, used, limit):
+        super(MemoryLimitExceeded, self).__init__("Memory capacity of %d bytes for session temporary tables exceeded, "
+                                                  "%d bytes used" % (limit, used), ER_CAPACITY_EXCEEDED)
+        self.used = used
+        self.limit = limit
+
+    def __reduce__(self):
+        return self.__class__, (self.used, self.limit)
+
+
+class QueryMemoryAccount(object):
+    def __init__(self, limit=0, canceller=None):
+        self.limit = limit
+        self.canceller = canceller
+        self.collections = []
+        self.used = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def attach(self, collection):
+        with self.lock:
+            self.collections.append(collection)
+
+    def detach(self, collection):
+        with self.lock:
+            for i in range(len(self.collections)):
+                if self.collections[i] is collection:
+                    del self.collections[i]
+                    return
+
+    def measure(self):
+        with self.lock:
+            collections = list(self.collections)
+        used = sum(get_collection_size(collection) for collection in collections)
+        with self.lock:
+            self.used = used
+            if used > self.peak:
+                self.peak = used
+        return used
+
+    def check(self):
+        used = self.measure()
+        if self.limit > 0 and used > self.limit and self.canceller is not None:
+            self.canceller.cancel("memory")
+            self.canceller.check()
+        return used
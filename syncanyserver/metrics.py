@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import time
+import threading
+from collections import defaultdict, OrderedDict
+from syncany.logger import get_logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                          for key, value in labels) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+def get_rows_bytes(rows, sample_count=100):
+    if not rows:
+        return 0
+    sample_size, sample_rows = 0, rows[:sample_count]
+    for row in sample_rows:
+        for value in row:
+            if value is None:
+                sample_size += 1
+            elif isinstance(value, (str, bytes)):
+                sample_size += len(value) + 1
+            else:
+                sample_size += len(str(value)) + 1
+    return int(sample_size * len(rows) / len(sample_rows))
+
+
+def parse_sample_line(line):
+    name_labels, value = line.rsplit(" ", 1)
+    index = name_labels.find("{")
+    if index < 0:
+        return name_labels, "", value
+    return name_labels[:index], name_labels[index + 1:-1], value
+
+
+def merge_renders(renders, label_name):
+    families = OrderedDict()
+    for label_value, render in renders:
+        family_name, family = None, None
+        label = format_labels(((label_name, label_value),))[1:-1] if label_value is not None else ""
+        for line in render.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family_name, family = parts[2], families.setdefault(parts[2], ([], []))
+                    if line not in family[0]:
+                        family[0].append(line)
+                continue
+            sample_name, labels, value = parse_sample_line(line)
+            if family is None or not sample_name.startswith(family_name):
+                family_name, family = sample_name, families.setdefault(sample_name, ([], []))
+            labels = ",".join([part for part in (label, labels) if part])
+            family[1].append("%s{%s} %s" % (sample_name, labels, value) if labels else "%s %s" % (sample_name, value))
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i in range(len(self.buckets)):
+            if value <= self.buckets[i]:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        samples, count = [], 0
+        for i in range(len(self.buckets)):
+            count += self.counts[i]
+            samples.append((name + "_bucket", labels + (("le", format_value(float(self.buckets[i]))),), count))
+        samples.append((name + "_bucket", labels + (("le", "+Inf"),), self.count))
+        samples.append((name + "_sum", labels, self.sum))
+        samples.append((name + "_count", labels, self.count))
+        return samples
+
+
+class Metrics(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: defaultdict(int))
+        self.histograms = defaultdict(dict)
+        self.helps = {}
+        self.collectors = []
+        self.start_time = time.time()
+
+        self.describe("syncany_queries_total", "counter", "Queries executed by status")
+        self.describe("syncany_query_wait_seconds", "histogram", "Query wait time in the scheduler queue")
+        self.describe("syncany_query_execute_seconds", "histogram", "Query execute time after leaving the queue")
+        self.describe("syncany_query_rows_total", "counter", "Rows returned to clients")
+        self.describe("syncany_query_bytes_total", "counter", "Estimated text protocol bytes returned to clients")
+        self.describe("syncany_executor_busy_seconds_total", "counter", "Time executor workers spent executing queries")
+        self.describe("syncany_table_executes_total", "counter", "Virtual table script executions")
+        self.describe("syncany_table_execute_seconds", "histogram", "Virtual table script execute time")
+        self.describe("syncany_table_rows_total", "counter", "Rows produced by virtual table scripts")
+        self.describe("syncany_materialized_refreshes_total", "counter", "Materialized table refreshes by status")
+        self.describe("syncany_materialized_refresh_seconds", "histogram", "Materialized table refresh time")
+        self.describe("syncany_materialized_rows", "gauge", "Rows in the current materialized table snapshot")
+        self.describe("syncany_materialized_age_seconds", "gauge", "Seconds since the materialized table snapshot "
+                                                                   "was refreshed")
+        self.describe("syncany_uptime_seconds", "gauge", "Seconds since the server started")
+
+    def describe(self, name, kind, help):
+        self.helps[name] = (kind, help)
+
+    def inc(self, name, labels=(), value=1):
+        with self.lock:
+            self.counters[name][labels] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms[name].get(labels)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[name][labels] = histogram
+            histogram.observe(value)
+
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+
+    def observe_query(self, database, username, status, wait_time, execute_time, rows, bytes):
+        labels = (("database", database or ""), ("user", username or ""))
+        self.inc("syncany_queries_total", labels + (("status", status),))
+        self.observe("syncany_query_wait_seconds", labels, wait_time)
+        self.observe("syncany_query_execute_seconds", labels, execute_time)
+        self.inc("syncany_query_rows_total", labels, rows)
+        self.inc("syncany_query_bytes_total", labels, bytes)
+        self.inc("syncany_executor_busy_seconds_total", (), execute_time)
+
+    def observe_table(self, database, table, execute_time, rows, cached):
+        labels = (("database", database or ""), ("table", table))
+        self.inc("syncany_table_executes_total", labels + (("cached", "true" if cached else "false"),))
+        self.observe("syncany_table_execute_seconds", labels, execute_time)
+        self.inc("syncany_table_rows_total", labels, rows)
+
+    def observe_materialized(self, database, table, status, execute_time, rows):
+        labels = (("database", database or ""), ("table", table))
+        self.inc("syncany_materialized_refreshes_total", labels + (("status", status),))
+        if status == "success":
+            self.observe("syncany_materialized_refresh_seconds", labels, execute_time)
+
+    def samples(self, collectors=True):
+        samples = []
+        with self.lock:
+            for name, values in self.counters.items():
+                samples.append((name, [(name, labels, value) for labels, value in values.items()]))
+            for name, histograms in self.histograms.items():
+                histogram_samples = []
+                for labels, histogram in histograms.items():
+                    histogram_samples.extend(histogram.samples(name, labels))
+                samples.append((name, histogram_samples))
+        samples.append(("syncany_uptime_seconds", [("syncany_uptime_seconds", (), time.time() - self.start_time)]))
+        for collector in (self.collectors if collectors else []):
+            try:
+                for name, labels, value in collector():
+                    samples.append((name, [(name, labels, value)]))
+            except Exception as e:
+                get_logger().warning("metrics collector error: %s", e)
+        return samples
+
+    def render(self):
+        lines, described = [], set()
+        for name, name_samples in self.samples():
+            if name not in described:
+                described.add(name)
+                kind, help = self.helps.get(name, ("untyped", ""))
+                if help:
+                    lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s %s" % (name, kind))
+            for sample_name, labels, value in name_samples:
+                lines.append("%s%s %s" % (sample_name, format_labels(labels), format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def get_status(self):
+        rows = []
+        for name, name_samples in self.samples(False):
+            for sample_name, labels, value in name_samples:
+                if sample_name.endswith("_bucket"):
+                    continue
+                rows.append((sample_name + format_labels(labels), format_value(value)))
+        return rows
+
+    async def handle_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while True:
+                line = await reader.readline()
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+            path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b"/"
+            if path.split(b"?")[0] in (b"/", b"/metrics"):
+                status, body = b"200 OK", self.render().encode("utf-8")
+            else:
+                status, body = b"404 Not Found", b"not found\n"
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode("utf-8") + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except Exception as e:
+            get_logger().warning("metrics http request error: %s", e)
+        finally:
+            writer.close()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import datetime
+import threading
+from decimal import Decimal
+from collections import OrderedDict
+from sqlglot import maybe_parse
+from sqlglot import expressions as sqlglot_expressions
+from sqlglot.tokens import Token, TokenType
+from syncanysql.compiler import CompilerDialect
+
+PLAN_CACHE_SIZE = 1024
+SLOT_PREFIX = "\x00slot:"
+TEXT_SLOT_TOKEN_TYPES = (TokenType.NUMBER, TokenType.STRING)
+PREPARE_SLOT_TOKEN_TYPES = (TokenType.PLACEHOLDER,)
+ROUTED_SQL_PREFIXES = ("show ", "set ", "kill ", "begin", "commit", "rollback", "flush")
+
+
+def get_const_value(expression):
+    if isinstance(expression, sqlglot_expressions.Paren):
+        return get_const_value(expression.args.get("this"))
+    if isinstance(expression, sqlglot_expressions.Null):
+        return True, None
+    if isinstance(expression, sqlglot_expressions.Boolean):
+        return True, bool(expression.args.get("this"))
+    if isinstance(expression, sqlglot_expressions.Literal):
+        if expression.is_string:
+            return True, expression.name
+        try:
+            return True, int(expression.name)
+        except ValueError:
+            try:
+                return True, float(expression.name)
+            except ValueError:
+                return False, None
+    if isinstance(expression, sqlglot_expressions.Neg):
+        is_const, value = get_const_value(expression.args.get("this"))
+        if is_const and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return True, -value
+    return False, None
+
+
+def get_const_values(expressions):
+    values = []
+    for expression in expressions:
+        is_const, value = get_const_value(expression)
+        if not is_const:
+            return False, None
+        values.append(value)
+    return True, values
+
+
+def build_value_expression(value):
+    if value is None:
+        return sqlglot_expressions.Null()
+    if isinstance(value, bool):
+        return sqlglot_expressions.Boolean(this=value)
+    if isinstance(value, (int, float, Decimal)):
+        if value < 0:
+            return sqlglot_expressions.Neg(this=sqlglot_expressions.Literal.number(repr(-value) if isinstance(value, float)
+                                                                                   else str(-value)))
+        return sqlglot_expressions.Literal.number(repr(value) if isinstance(value, float) else str(value))
+    if isinstance(value, (bytes, bytearray)):
+        return sqlglot_expressions.Literal.string(bytes(value).decode("utf-8", "replace"))
+    if isinstance(value, datetime.datetime):
+        return sqlglot_expressions.Literal.string(value.strftime("%Y-%m-%d %H:%M:%S.%f" if value.microsecond
+                                                                 else "%Y-%m-%d %H:%M:%S"))
+    return sqlglot_expressions.Literal.string(str(value))
+
+
+def is_routed_sql(sql):
+    lower_sql = sql.lstrip().lower()
+    return lower_sql.startswith(ROUTED_SQL_PREFIXES) or "information_schema" in lower_sql \
+        or "performance_schema" in lower_sql
+
+
+def normalize_tokens(tokens, slot_token_types):
+    key, slot_tokens, slot_values = [], [], []
+    for token in tokens:
+        if token.comments or token.token_type == TokenType.HINT:
+            return None, None, None
+        if token.token_type not in slot_token_types:
+            key.append((token.token_type, token.text))
+            slot_tokens.append(token)
+            continue
+        key.append(token.token_type)
+        slot_tokens.append(Token(TokenType.STRING if token.token_type == TokenType.STRING else TokenType.NUMBER,
+                                 SLOT_PREFIX + str(len(slot_values)), token.line, token.col, token.end))
+        slot_values.append(token)
+    return (slot_token_types,) + tuple(key), slot_tokens, slot_values
+
+
+class QueryPlan(object):
+    def __init__(self, sql, expressions, slot_count):
+        self.sql = sql
+        self.expressions = expressions
+        self.slot_count = slot_count
+
+    @classmethod
+    def build(cls, dialect, sql, slot_tokens, slot_count):
+        try:
+            expressions = dialect.parser().parse(slot_tokens, sql)
+        except Exception:
+            return None
+        slots = []
+        for expression in expressions:
+            if expression is None:
+                continue
+            for literal_expression in expression.find_all(sqlglot_expressions.Literal):
+                if literal_expression.name.startswith(SLOT_PREFIX):
+                    slots.append(int(literal_expression.name[len(SLOT_PREFIX):]))
+            if any(isinstance(value, str) and SLOT_PREFIX in value
+                   for node in expression.walk(bfs=False) if not isinstance(node[0], sqlglot_expressions.Literal)
+                   for value in node[0].args.values()):
+                return None
+        if sorted(slots) != list(range(slot_count)):
+            return None
+        return cls(sql, expressions, slot_count)
+
+    def bind(self, value_expressions):
+        if len(value_expressions) != self.slot_count:
+            raise ValueError("plan parameter count error, expected %d got %d" % (self.slot_count, len(value_expressions)))
+        expressions = []
+        for expression in self.expressions:
+            if expression is None:
+                expressions.append(None)
+                continue
+            expression = expression.copy()
+            for literal_expression in list(expression.find_all(sqlglot_expressions.Literal)):
+                if not literal_expression.name.startswith(SLOT_PREFIX):
+                    continue
+                value_expression = value_expressions[int(literal_expression.name[len(SLOT_PREFIX):])]
+                if literal_expression.is_string and isinstance(value_expression, sqlglot_expressions.Literal) \
+                        and not value_expression.is_string:
+                    value_expression = sqlglot_expressions.Literal.string(value_expression.name)
+                literal_expression.replace(value_expression)
+            expressions.append(expression)
+        return expressions
+
+
+class ScriptPlan(object):
+    def __init__(self, expression, mapping):
+        self.expression = expression
+        self.mapping = mapping
+
+    @classmethod
+    def build(cls, compiler, sql):
+        escape_sql = sql
+        if "\\\\" in sql:
+            for escape_char in compiler.ESCAPE_CHARS:
+                escape_sql = escape_sql.replace(escape_char, "\\\\\\" + escape_char)
+        origin_mapping = dict(compiler.mapping)
+        try:
+            expression = maybe_parse(compiler.parse_mapping(escape_sql), dialect=CompilerDialect)
+        except Exception:
+            return None
+        finally:
+            mapping, compiler.mapping = compiler.mapping, origin_mapping
+        return cls(expression, {key: value for key, value in mapping.items() if key not in origin_mapping})
+
+    def compile(self, compiler, arguments):
+        compiler.mapping.update(self.mapping)
+        return compiler.compile_expression(self.expression.copy(), arguments)
+
+
+class QueryPlanCache(object):
+    def __init__(self, max_size=PLAN_CACHE_SIZE):
+        self.max_size = max_size
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            plan = self.plans.get(key)
+            if plan is None:
+                self.misses += 1
+                return None
+            self.plans.move_to_end(key)
+            if plan is False:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return plan
+
+    def set(self, key, plan):
+        with self.lock:
+            self.plans[key] = plan
+            self.plans.move_to_end(key)
+            while len(self.plans) > self.max_size:
+                self.plans.popitem(last=False)
+
+    def load(self, dialect, sql, tokens, slot_token_types):
+        key, slot_tokens, slot_values = normalize_tokens(tokens, slot_token_types)
+        if key is None:
+            return None, None
+        plan = self.get(key)
+        if plan is None:
+            plan = QueryPlan.build(dialect, sql, slot_tokens, len(slot_values)) or False
+            self.set(key, plan)
+        return plan or None, slot_values
+
+    def parse(self, dialect, sql):
+        tokens = dialect.tokenize(sql)
+        if self.max_size > 0:
+            plan, slot_values = self.load(dialect, sql, tokens, TEXT_SLOT_TOKEN_TYPES)
+            if plan is not None:
+                return plan.bind([sqlglot_expressions.Literal(this=token.text,
+                                                              is_string=token.token_type == TokenType.STRING)
+                                  for token in slot_values])
+        return dialect.parser().parse(tokens, sql)
+
+    def prepare(self, dialect, sql):
+        if is_routed_sql(sql):
+            return None
+        try:
+            tokens = dialect.tokenize(sql)
+        except Exception:
+            return None
+        return self.load(dialect, sql, tokens, PREPARE_SLOT_TOKEN_TYPES)[0]
+
+    def compile_script(self, compiler, sql, arguments, origin_compile):
+        if self.max_size <= 0 or sql[:4].lower() in ("set ", "use "):
+            return origin_compile(compiler, sql, arguments)
+        key = ("script", sql)
+        plan = self.get(key)
+        if plan is None:
+            plan = ScriptPlan.build(compiler, sql) or False
+            self.set(key, plan)
+        if plan is False:
+            return origin_compile(compiler, sql, arguments)
+        return plan.compile(compiler, arguments)
+
+    def clear(self):
+        with self.lock:
+            self.plans.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {"size": len(self.plans), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sqlglot import expressions as sqlglot_expressions
+from mysql_mimic.results import ResultColumn
+from mysql_mimic.variables import GlobalVariables, SessionVariables, SYSTEM_VARIABLES
+from syncany.logger import get_logger
+from syncany.taskers.core import CoreTasker
+from .encoder import SQL_COMMON_TYPES
+from .executor import QueryCanceller
+from .profile import QueryProfile
+
+_process_server = None
+
+
+def is_process_value(value):
+    if value is None or isinstance(value, SQL_COMMON_TYPES):
+        return True
+    if isinstance(value, (list, tuple, set)):
+        return all(is_process_value(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and is_process_value(v) for k, v in value.items())
+    return False
+
+
+def collect_env_variables(env_variables, root_env_variables):
+    env_variables_layers = []
+    while env_variables is not None and env_variables is not root_env_variables:
+        env_variables_layers.append(env_variables)
+        env_variables = env_variables.parent
+    variables = {}
+    for env_variables in reversed(env_variables_layers):
+        variables.update(env_variables)
+    return variables
+
+
+class ProcessServer(object):
+    def __init__(self, config_path, is_scan_database, result_cache_size, scan_manifest=None):
+        from .server import Server, TABLE_PARALLELISM
+        from .cache import TableScriptCache, ResultCache
+        from .database import Database, Catalog
+        from .user import UserIdentityProvider
+        from .plan import QueryPlanCache
+
+        self.config_path = config_path
+        self.is_scan_database = is_scan_database
+        self.script_engine = Server.create_script_engine()
+        self.identity_provider = UserIdentityProvider(config_path)
+        self.catalog = Catalog()
+        self.table_script_cache = TableScriptCache()
+        self.result_cache = ResultCache(result_cache_size)
+        self.global_variables = GlobalVariables(dict(SYSTEM_VARIABLES))
+        self.plan_cache = QueryPlanCache()
+        self.table_thread_pool_executor = ThreadPoolExecutor(TABLE_PARALLELISM, thread_name_prefix="syncany-table")
+        self.version = 0
+        self.flush_version = 0
+        Server.install_compiler_hooks(self.catalog, self.plan_cache)
+        Database.scan_databases(self.config_path, self.script_engine, self.catalog, self.is_scan_database,
+                                self.table_script_cache, True, scan_manifest)
+        self.script_engine.manager.database_manager.warmup()
+
+    def reload(self, version, flush_version):
+        from .database import Database
+
+        if version == self.version and flush_version == self.flush_version:
+            return
+        get_logger().info("process server reload %d -> %d", self.version, version)
+        is_full = flush_version != self.flush_version
+        if is_full or self.identity_provider.version != self.identity_provider.get_version():
+            self.identity_provider.load_users()
+        if is_full:
+            self.table_script_cache.clear()
+            self.result_cache.clear()
+        Database.scan_databases(self.config_path, self.script_engine, self.catalog, self.is_scan_database,
+                                self.table_script_cache, is_full, None, is_full)
+        self.version, self.flush_version = version, flush_version
+
+    def create_session(self, username, database, variables, env_variables, execute_index, executor_wait_timeout):
+        from .server import ServerSession, ServerSessionExecuterContext
+        from syncanysql import Executor
+
+        executor = Executor(self.script_engine.manager, self.script_engine.executor.session_config.session(),
+                            self.script_engine.executor)
+        executor.env_variables.update(env_variables)
+        session = ServerSession(self.config_path, ServerSessionExecuterContext(self.script_engine, executor),
+                                self.identity_provider, None, self.catalog, executor_wait_timeout,
+                                is_scan_database=self.is_scan_database, table_script_cache=self.table_script_cache,
+                                result_cache=self.result_cache, plan_cache=self.plan_cache,
+                                table_thread_pool_executor=self.table_thread_pool_executor,
+                                variables=SessionVariables(self.global_variables))
+        session.variables.values.update(variables)
+        session.username = username
+        session.database = database
+        session.execute_index = execute_index
+        session.catalog_snapshot = self.catalog.current()
+        return session
+
+    def execute_query(self, version, flush_version, sql, username, database, variables, env_variables, execute_index,
+                      executor_wait_timeout, timeout, profiling, start_time):
+        query_profile = QueryProfile(execute_index, sql) if profiling else None
+        self.reload(version, flush_version)
+        session = self.create_session(username, database, variables, env_variables, execute_index,
+                                      executor_wait_timeout)
+        expression = session.dialect().parse(sql)[0]
+        session.query_canceller = QueryCanceller(timeout)
+        session.query_profile = query_profile
+        if query_profile is not None:
+            query_profile.lap("starting worker")
+        try:
+            rows, columns = session.execute_query(expression, start_time)
+        finally:
+            session.query_canceller.close()
+        query_phases = query_profile.get_phases() if query_profile is not None else None
+        if not rows:
+            return [], [], session.table_statistics, query_phases
+        return rows, [(column.name, column.type) if isinstance(column, ResultColumn) else (column, None)
+                      for column in columns], session.table_statistics, query_phases
+
+
+def init_process(config_path, is_scan_database, result_cache_size, scan_manifest=None):
+    global _process_server
+
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    _process_server = ProcessServer(config_path, is_scan_database, result_cache_size, scan_manifest)
+
+
+def execute_process_query(*args):
+    return _process_server.execute_query(*args)
+
+
+class ProcessQueryExecutor(object):
+    def __init__(self, max_workers, config_path, is_scan_database, result_cache_size, scan_manifest=None):
+        self.max_workers = max_workers
+        self.config_path = config_path
+        self.is_scan_database = is_scan_database
+        self.result_cache_size = result_cache_size
+        self.scan_manifest = scan_manifest
+        self.version = 0
+        self.flush_version = 0
+        self.process_pool_executor = self.create_process_pool_executor()
+
+    def create_process_pool_executor(self):
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_process,
+                                   initargs=(self.config_path, self.is_scan_database, self.result_cache_size,
+                                             self.scan_manifest))
+
+    def is_executable(self, session, expression):
+        if not isinstance(expression, (sqlglot_expressions.Select, sqlglot_expressions.Union)) \
+                or expression.args.get("into"):
+            return False
+        executer_context = session.executer_context
+        if executer_context.transaction_contexts or executer_context.memory_database_collection:
+            return False
+        if session.has_materialized_tables(expression):
+            return False
+        if executer_context.executor.session_config.config != CoreTasker.DEFAULT_CONFIG:
+            return False
+        env_variables = collect_env_variables(executer_context.executor.env_variables,
+                                              executer_context.engine.executor.env_variables)
+        return all(is_process_value(value) for value in env_variables.values())
+
+    async def execute_query(self, session, expression, start_time, timeout=0, query_profile=None):
+        executer_context = session.executer_context
+        env_variables = collect_env_variables(executer_context.executor.env_variables,
+                                              executer_context.engine.executor.env_variables)
+        process_pool_executor = self.process_pool_executor
+        session_table_statistics = session.table_statistics
+        try:
+            rows, columns, table_statistics, query_phases = await session.loop.run_in_executor(
+                process_pool_executor, execute_process_query, self.version, self.flush_version,
+                session.generate_sql(expression), session.username, session.database, dict(session.variables.values),
+                env_variables,
+                session.execute_index, session.executor_wait_timeout, timeout, query_profile is not None, start_time)
+        except BrokenProcessPool:
+            if process_pool_executor is self.process_pool_executor:
+                get_logger().error("process pool broken, restarting")
+                self.process_pool_executor = self.create_process_pool_executor()
+                process_pool_executor.shutdown(wait=False)
+            raise
+        session_table_statistics.extend(table_statistics)
+        if query_profile is not None:
+            elapsed = time.time() - query_profile.last_time
+            query_profile.extend(query_phases)
+            query_profile.add("transferring process", max(elapsed - sum(duration for _, duration in query_phases), 0))
+        if not columns:
+            return rows, columns
+        return rows, [ResultColumn(name=name, type=column_type) if column_type is not None else name
+                      for name, column_type in columns]
+
+    def reload(self, is_full=True):
+        self.version += 1
+        if is_full:
+            self.flush_version += 1
+
+    def shutdown(self):
+        self.process_pool_executor.shutdown(wait=False, cancel_futures=True)
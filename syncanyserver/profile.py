@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import time
+import threading
+from syncany.hook import Hooker
+
+
+class QueryProfile(object):
+    def __init__(self, query_id, sql):
+        self.query_id = query_id
+        self.sql = sql
+        self.phases = {}
+        self.start_time = time.time()
+        self.last_time = self.start_time
+        self.duration = 0
+        self.lock = threading.Lock()
+
+    def add(self, status, duration):
+        with self.lock:
+            self.phases[status] = self.phases.get(status, 0) + duration
+            self.duration += duration
+
+    def lap(self, status):
+        now = time.time()
+        with self.lock:
+            duration, self.last_time = now - self.last_time, now
+            self.phases[status] = self.phases.get(status, 0) + duration
+            self.duration += duration
+
+    def extend(self, phases):
+        for status, duration in phases:
+            self.add(status, duration)
+        with self.lock:
+            self.last_time = time.time()
+
+    def get_phases(self):
+        with self.lock:
+            return list(self.phases.items())
+
+    def attach(self, tasker, prefix=""):
+        core_tasker = getattr(tasker, "tasker", None)
+        if core_tasker is None or not hasattr(core_tasker, "add_hooker"):
+            return
+        core_tasker.add_hooker(ProfileHooker(self, prefix))
+        for dependency_tasker in getattr(tasker, "dependency_taskers", None) or []:
+            self.attach(dependency_tasker, prefix)
+
+
+class ProfileHooker(Hooker):
+    def __init__(self, profile, prefix=""):
+        self.profile = profile
+        self.prefix = prefix
+
+    def queried(self, tasker, datas):
+        self.profile.lap(self.prefix + "fetching")
+        return datas
+
+    def loaded(self, tasker, datas):
+        self.profile.lap(self.prefix + "joining")
+        return datas
+
+    def outputed(self, tasker, datas):
+        self.profile.lap(self.prefix + "storing")
+
+    def finaled(self, tasker, e=None):
+        self.profile.lap(self.prefix + "cleaning up")
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import time
+import heapq
+import asyncio
+from collections import defaultdict
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {"high": PRIORITY_HIGH, "normal": PRIORITY_NORMAL, "low": PRIORITY_LOW}
+
+
+class SchedulerTicket(object):
+    def __init__(self, username, database, priority, user_concurrency, database_concurrency):
+        self.username = username
+        self.database = database
+        self.priority = priority
+        self.user_concurrency = user_concurrency
+        self.database_concurrency = database_concurrency
+        self.queue_time = time.time()
+        self.start_time = None
+        self.future = None
+        self.released = False
+
+
+class QueryScheduler(object):
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.low_max_concurrency = max(self.max_concurrency - 1, 1)
+        self.waitings = []
+        self.waiting_counts = defaultdict(int)
+        self.running_count = 0
+        self.running_low_count = 0
+        self.user_running_counts = defaultdict(int)
+        self.database_running_counts = defaultdict(int)
+        self.sequence = 0
+        self.total_queries = 0
+        self.total_wait_time = 0
+        self.max_wait_time = 0
+        self.timeouts = 0
+
+    def is_runnable(self, ticket):
+        if self.running_count >= self.max_concurrency:
+            return False
+        if ticket.priority == PRIORITY_LOW and self.running_low_count >= self.low_max_concurrency:
+            return False
+        if ticket.user_concurrency and self.user_running_counts[ticket.username] >= ticket.user_concurrency:
+            return False
+        if ticket.database_concurrency and self.database_running_counts[ticket.database] >= ticket.database_concurrency:
+            return False
+        return True
+
+    def start(self, ticket):
+        ticket.start_time = time.time()
+        self.running_count += 1
+        if ticket.priority == PRIORITY_LOW:
+            self.running_low_count += 1
+        self.user_running_counts[ticket.username] += 1
+        self.database_running_counts[ticket.database] += 1
+        wait_time = ticket.start_time - ticket.queue_time
+        self.total_queries += 1
+        self.total_wait_time += wait_time
+        if wait_time > self.max_wait_time:
+            self.max_wait_time = wait_time
+
+    async def acquire(self, username, database, priority=PRIORITY_NORMAL, user_concurrency=0,
+                      database_concurrency=0, timeout=None):
+        ticket = SchedulerTicket(username, database, priority, user_concurrency, database_concurrency)
+        ticket.future = asyncio.get_running_loop().create_future()
+        self.sequence += 1
+        heapq.heappush(self.waitings, (priority, self.sequence, ticket))
+        self.waiting_counts[priority] += 1
+        self.dispatch()
+        if ticket.future.done():
+            return ticket
+
+        try:
+            if timeout:
+                await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+            else:
+                await ticket.future
+        except BaseException as e:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release(ticket)
+            else:
+                ticket.future.cancel()
+                self.remove(ticket)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise TimeoutError("query execute wait timeout")
+            raise
+        return ticket
+
+    def remove(self, ticket):
+        for i in range(len(self.waitings)):
+            if self.waitings[i][2] is ticket:
+                self.waitings.pop(i)
+                heapq.heapify(self.waitings)
+                self.waiting_counts[ticket.priority] -= 1
+                break
+        self.dispatch()
+
+    def release(self, ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        self.running_count -= 1
+        if ticket.priority == PRIORITY_LOW:
+            self.running_low_count -= 1
+        self.user_running_counts[ticket.username] -= 1
+        if self.user_running_counts[ticket.username] <= 0:
+            self.user_running_counts.pop(ticket.username, None)
+        self.database_running_counts[ticket.database] -= 1
+        if self.database_running_counts[ticket.database] <= 0:
+            self.database_running_counts.pop(ticket.database, None)
+        self.dispatch()
+
+    def dispatch(self):
+        if not self.waitings or self.running_count >= self.max_concurrency:
+            return
+        blocked_waitings = []
+        while self.waitings and self.running_count < self.max_concurrency:
+            waiting = heapq.heappop(self.waitings)
+            ticket = waiting[2]
+            if ticket.future.done():
+                self.waiting_counts[ticket.priority] -= 1
+                continue
+            if not self.is_runnable(ticket):
+                blocked_waitings.append(waiting)
+                continue
+            self.waiting_counts[ticket.priority] -= 1
+            self.start(ticket)
+            ticket.future.set_result(ticket)
+        for waiting in blocked_waitings:
+            heapq.heappush(self.waitings, waiting)
+
+    def get_stats(self):
+        now = time.time()
+        oldest_wait_time = max([now - waiting[2].queue_time for waiting in self.waitings] or [0])
+        return {
+            "running": self.running_count, "running_low": self.running_low_count,
+            "max_concurrency": self.max_concurrency, "queued": len(self.waitings),
+            "queued_high": self.waiting_counts[PRIORITY_HIGH], "queued_normal": self.waiting_counts[PRIORITY_NORMAL],
+            "queued_low": self.waiting_counts[PRIORITY_LOW], "queries": self.total_queries,
+            "wait_time_ms": int(self.total_wait_time * 1000), "max_wait_time_ms": int(self.max_wait_time * 1000),
+            "avg_wait_time_ms": int(self.total_wait_time * 1000 / self.total_queries) if self.total_queries else 0,
+            "oldest_wait_time_ms": int(oldest_wait_time * 1000), "timeouts": self.timeouts,
+        }
@@ -2,6 +2,8 @@
 # 2025/11/21
 # create by: snower
 
+from concurrent.futures import ThreadPoolExecutor
+from syncany.logger import get_logger
 from syncany.database import find_database, DatabaseUnknownException
 from ..database import Database
 from .mysql_loader import MysqlSchemaLoader
@@ -14,8 +16,17 @@ SCHEMA_LOADERS = {
 }
 
 
+def load_database_schema(script_engine, database_cls, schema_loader, database_config):
+    database = database_cls(script_engine.manager.database_manager, database_config).build()
+    connection = database.ensure_connection()
+    try:
+        return schema_loader.load_tables(script_engine, database, connection)
+    finally:
+        database.release_connection()
+
+
 def load_database_schemas(script_engine, databases):
-    database_manager = script_engine.manager.database_manager
+    load_configs = []
     for database_config in script_engine.config.get().get("databases"):
         database_config = dict(**database_config)
         database_name = database_config.get("name")
@@ -28,13 +39,20 @@ def load_database_schemas(script_engine, databases):
             database_cls = find_database(database_driver)
         except DatabaseUnknownException:
             continue
-        schema_loader = SCHEMA_LOADERS[database_driver]
-        database = database_cls(database_manager, database_config).build()
-        connection = database.ensure_connection()
-        try:
-            tables = schema_loader.load_tables(script_engine, database, connection)
+        load_configs.append((database_name, database_cls, SCHEMA_LOADERS[database_driver], database_config))
+    if not load_configs:
+        return
+
+    with ThreadPoolExecutor(min(len(load_configs), 16), thread_name_prefix="syncany-schema") as thread_pool_executor:
+        load_futures = [(database_name, thread_pool_executor.submit(load_database_schema, script_engine, database_cls,
+                                                                    schema_loader, database_config))
+                        for database_name, database_cls, schema_loader, database_config in load_configs]
+        for database_name, load_future in load_futures:
+            try:
+                tables = load_future.result()
+            except Exception as e:
+                get_logger().warning("schema scan load database %s error %s", database_name, str(e))
+                continue
             if not tables:
                 continue
             databases[database_name] = Database(database_name, tables)
-        finally:
-            database.release_connection()
\ No newline at end of file
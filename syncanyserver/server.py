@@ -2,25 +2,26 @@
 # 2023/5/4
 # create by: snower
 
-import decimal
-import json
 import sys
 import os
+import re
 import time
-import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures, FIRST_COMPLETED
 from mysql_mimic.types import ColumnType
 from sqlglot import expressions as sqlglot_expressions
 from sqlglot import dialects as sqlglot_dialects
 from sqlglot import parser as sqlglot_parser
 from mysql_mimic import Session, MysqlServer
+from mysql_mimic.stream import MysqlStream
+from mysql_mimic.variables import GlobalVariables, SessionVariables, SYSTEM_VARIABLES
 from mysql_mimic.errors import MysqlError, ErrorCode
 from mysql_mimic.intercept import expression_to_value
+from mysql_mimic.schema import like_to_regex
+from mysql_mimic.prepared import REGEX_PARAM
 from syncany.logger import get_logger, set_verbose_logger
 from syncany.taskers.manager import TaskerManager
-from syncany.database.memory import MemoryDBCollection
 from syncanysql.compiler import Compiler, AssignParameter
 from syncanysql.taskers.query import QueryTasker
 from syncanysql.taskers.explain import ExplainTasker
@@ -28,10 +29,28 @@ from syncanysql import ScriptEngine, Executor, ExecuterContext, SqlSegment, SqlP
 from syncanysql.parser import FileParser
 from .filters import register_filters
 from .user import UserIdentityProvider
-from .database import DatabaseManager, Database
-
-SQL_COMMON_TYPES = (bool, int, float, str, bytes, datetime.date, datetime.time, decimal.Decimal)
-SQL_COMPLICACY_TYPES = (set, dict, list, tuple)
+from .database import DatabaseManager, Database, Catalog
+from .cache import TableScriptCache, ResultCache, get_datas_size
+from .stream import ResultStream, ResultStreamDatas
+from .encoder import ResultEncoder
+from .table import Table
+from .connection import ServerConnection
+from .process import ProcessQueryExecutor
+from .executor import QueryCanceller, QueryInterrupted, CancellableExecutor, ER_NO_SUCH_THREAD, ER_KILL_DENIED_ERROR
+from .metrics import Metrics, get_rows_bytes
+from .profile import QueryProfile
+from .watcher import ConfigWatcher
+from .materialize import MaterializedStore, MaterializedRefresher
+from .memory import LayeredMemoryDBCollection, CopyOnWriteDatas, QueryMemoryAccount, MemoryLimitExceeded, \
+    get_collection_size
+from .columnar import compact_datas
+from .spill import MemoryBudget, SpillDatas, SPILL_BATCH_SIZE, close_result
+from .plan import QueryPlanCache, get_const_value, get_const_values, build_value_expression
+from .scheduler import QueryScheduler, PRIORITY_NAMES, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+JOIN_KEY_BATCH_SIZE = 1000
+JOIN_KEY_MAX_BATCHES = 16
+TABLE_PARALLELISM = 8
 
 
 class ServerSessionExecuterContext(ExecuterContext):
@@ -39,9 +58,11 @@ class ServerSessionExecuterContext(ExecuterContext):
         self.session = kwargs.pop("session", None)
         super(ServerSessionExecuterContext, self).__init__(*args, **kwargs)
 
-        self.memory_database_collection = MemoryDBCollection()
+        self.memory_database_collection = LayeredMemoryDBCollection()
         self.execting_primary_tables = None
+        self.output_schema = None
         self.transaction_contexts = None
+        self.query_profile = None
 
     def present(self):
         if self.transaction_contexts:
@@ -51,15 +72,24 @@ class ServerSessionExecuterContext(ExecuterContext):
     def context(self, session):
         if self.transaction_contexts:
             return self.transaction_contexts[-1].context(session)
-        executor = Executor(self.engine.manager, self.executor.session_config.session(), self.executor)
+        executor = CancellableExecutor(self.engine.manager, self.executor.session_config.session(), self.executor,
+                                       session.query_canceller if session else None)
         executer_context = ServerSessionExecuterContext(self.engine, executor, session=session)
-        executer_context.memory_database_collection.update(self.memory_database_collection)
+        executer_context.memory_database_collection = LayeredMemoryDBCollection(self.memory_database_collection)
+        executer_context.query_profile = session.query_profile if session else None
+        return executer_context
+
+    def table_context(self):
+        executer_context = ServerSessionExecuterContext(self.engine, self.executor, session=self.session)
+        executer_context.memory_database_collection = LayeredMemoryDBCollection(self.memory_database_collection)
+        if self.query_profile is not None:
+            executer_context.query_profile = QueryProfile(self.query_profile.query_id, self.query_profile.sql)
         return executer_context
 
     def begin_transaction(self, session):
-        executor = Executor(self.engine.manager, self.executor.session_config.session(), self.executor)
+        executor = CancellableExecutor(self.engine.manager, self.executor.session_config.session(), self.executor)
         executer_context = ServerSessionExecuterContext(self.engine, executor, session=session)
-        executer_context.memory_database_collection.update(self.memory_database_collection)
+        executer_context.memory_database_collection = LayeredMemoryDBCollection(self.memory_database_collection)
         if self.transaction_contexts is None:
             self.transaction_contexts = [executer_context]
         else:
@@ -106,7 +136,7 @@ class ServerSessionExecuterContext(ExecuterContext):
             executor.run("session[%s-%d]%s" % (id(self.session), self.session.execute_index, filename), sqls)
             executor.execute()
 
-    def execute_expression(self, expression, output_name=None):
+    def execute_expression(self, expression, output_name=None, batch=0):
         with self.executor as executor:
             name = "session[%s-%d]" % (id(self.session), self.session.execute_index)
             compiler = Compiler(executor.session_config, executor.env_variables, name)
@@ -114,12 +144,13 @@ class ServerSessionExecuterContext(ExecuterContext):
                          "@timeout": executor.env_variables.get("@timeout", 0),
                          "@limit": executor.env_variables.get("@limit", 1 if isinstance(expression, sqlglot_expressions.Command)
                                                                              and expression.args["this"].lower() == "explain" else 0),
-                         "@batch": executor.env_variables.get("@batch", 0),
+                         "@batch": executor.env_variables.get("@batch", batch),
                          "@streaming": executor.env_variables.get("@streaming", False),
                          "@recovery": executor.env_variables.get("@recovery", False),
                          "@join_batch": executor.env_variables.get("@join_batch", 10000),
                          "@insert_batch": executor.env_variables.get("@insert_batch", 0),
                          "@primary_order": False}
+            query_profile = self.session.query_profile if self.session else None
             tasker = compiler.compile_expression(expression, arguments)
             if output_name and isinstance(tasker, ExplainTasker):
                 tasker.tasker.config["output"] = "&." + output_name + "::" + tasker.tasker.config["output"].split("::")[-1]
@@ -137,7 +168,23 @@ class ServerSessionExecuterContext(ExecuterContext):
             if output_name and isinstance(tasker, QueryTasker):
                 tasker.config["output"] = "&." + output_name + "::" + tasker.config["output"].split("::")[-1]
             executor.runners.extend(tasker.start(name, executor, executor.session_config, executor.manager, arguments))
+            if output_name and isinstance(tasker, QueryTasker):
+                try:
+                    self.output_schema = Table.parse_schema(tasker)
+                except Exception:
+                    self.output_schema = None
+            if query_profile is not None:
+                query_profile.lap("compiling")
+                for runner in executor.runners:
+                    query_profile.attach(runner)
             executor.execute()
+            if query_profile is not None:
+                query_profile.lap("executing")
+            return self.output_schema
+
+    def get_memory_collections(self):
+        return [self.memory_database_collection] + [executer_context.memory_database_collection
+                                                    for executer_context in (self.transaction_contexts or [])]
 
     def commit_memory_datas(self, table_name, datas):
         if self.transaction_contexts:
@@ -238,22 +285,62 @@ class MySQL(sqlglot_dialects.MySQL):
 class ServerSession(Session):
     dialect = MySQL
 
-    def __init__(self, config_path, executer_context, identity_provider, thread_pool_executor, databases,
-                 executor_wait_timeout, *args, **kwargs):
+    def __init__(self, config_path, executer_context, identity_provider, thread_pool_executor, catalog,
+                 executor_wait_timeout, *args, is_scan_database=False, table_script_cache=None, result_cache=None,
+                 process_query_executor=None, query_scheduler=None, connections=None, metrics=None,
+                 materialized_store=None, memory_budget=None, spill_path=None, plan_cache=None,
+                 table_thread_pool_executor=None, **kwargs):
         super(ServerSession, self).__init__(*args, **kwargs)
 
-        self.loop = asyncio.get_running_loop()
+        self.loop = None
         self.config_path = config_path
         self.executer_context = executer_context
         self.identity_provider = identity_provider
         self.thread_pool_executor = thread_pool_executor
-        self.databases = databases
+        self.catalog = catalog
+        self.catalog_snapshot = None
         self.executor_wait_timeout = executor_wait_timeout
+        self.is_scan_database = is_scan_database
+        self.table_script_cache = table_script_cache
+        self.result_cache = result_cache
+        self.process_query_executor = process_query_executor
+        self.query_scheduler = query_scheduler
+        self.connections = connections
+        self.metrics = metrics
+        self.materialized_store = materialized_store
+        self.memory_budget = memory_budget
+        self.spill_path = spill_path
+        self.plan_cache = plan_cache
+        self.table_thread_pool_executor = table_thread_pool_executor
+        self.query_canceller = None
+        self.query_memory = None
+        self.query_sql = None
+        self.query_state = None
+        self.query_time = time.time()
+        self.table_statistics = []
+        self.query_parse_time = 0
+        self.query_profile = None
+        self.query_profiles = deque()
+        self.sending_query = None
         self.execute_index = 0
 
+    async def init(self, connection):
+        self.loop = asyncio.get_running_loop()
+        await super(ServerSession, self).init(connection)
+
+    @property
+    def databases(self):
+        catalog_snapshot = self.catalog_snapshot
+        if catalog_snapshot is None:
+            catalog_snapshot = self.catalog.current()
+        return catalog_snapshot.databases
+
     async def handle_query(self, sql, attrs):
         lower_sql = sql.lower()
+        if lower_sql[:5] == "kill ":
+            return await self.kill(sql)
         if lower_sql[:5] == "show " or lower_sql[:4] == "set " or lower_sql[:5] == "kill " or "information_schema" in lower_sql:
+            self.query_sql, self.query_state, self.query_time = sql, "executing", time.time()
             try:
                 return await super(ServerSession, self).handle_query(sql, attrs)
             except:
@@ -285,6 +372,8 @@ class ServerSession(Session):
                     return [], ('Field', 'Type', 'Collation', 'Null', 'Key', 'Default', 'Extra', 'Privileges',
                                 'Comment')
                 return [], []
+            finally:
+                self.query_sql, self.query_state, self.query_time = None, None, time.time()
         if lower_sql == "begin":
             self.executer_context.begin_transaction(self)
             return [], []
@@ -294,7 +383,39 @@ class ServerSession(Session):
         if lower_sql == "rollback":
             self.executer_context.rollback_transaction(self)
             return [], []
-        return await super(ServerSession, self).handle_query(sql, attrs)
+
+        parse_start_time = time.time()
+        expressions = self.plan_cache.parse(self.dialect(), sql) if self.plan_cache is not None \
+            else self.dialect().parse(sql)
+        self.query_parse_time = time.time() - parse_start_time
+        return await self.execute_expressions(expressions, sql, attrs)
+
+    def prepare(self, sql):
+        if self.plan_cache is None:
+            return None
+        return self.plan_cache.prepare(self.dialect(), sql)
+
+    def bind_sql(self, sql, params):
+        params = iter(params)
+        return REGEX_PARAM.sub(lambda matched: self.generate_sql(build_value_expression(next(params, None))), sql)
+
+    async def handle_prepared_query(self, plan, params, attrs):
+        parse_start_time = time.time()
+        expressions = plan.bind([build_value_expression(param) for param in params])
+        self.query_parse_time = time.time() - parse_start_time
+        return await self.execute_expressions(expressions, plan.sql, attrs)
+
+    async def execute_expressions(self, expressions, sql, attrs):
+        result = None
+        for expression in expressions:
+            if not expression:
+                continue
+            with self._set_var_hint(expression):
+                close_result(result)
+                result = await self._intercept(expression, sql, attrs)
+                if result is None:
+                    result = await self.query(expression, sql, attrs)
+        return result
 
     def _set_variable(self, setitem):
         assignment = setitem.this
@@ -333,6 +454,12 @@ class ServerSession(Session):
     async def _show_interceptor(self, expression):
         if isinstance(expression, sqlglot_expressions.Show):
             kind = expression.name.upper()
+            if kind == "PROFILES":
+                return self._show_profiles(expression)
+            if kind == "PROFILE":
+                return self._show_profile(expression)
+            if kind == "PROCESSLIST":
+                return self._show_processlist(expression)
             if kind != 'CREATE TABLE':
                 return await super(ServerSession, self)._show_interceptor(expression)
             db_name = expression.args.get("db").name
@@ -352,6 +479,86 @@ class ServerSession(Session):
                      (table_name, ",\n".join(column_sql)))], ("Table", "Create Table")
         return await super(ServerSession, self)._show_interceptor(expression)
 
+    def _show_profiles(self, show):
+        return [(query_profile.query_id, "%.8f" % query_profile.duration, query_profile.sql)
+                for query_profile in self.query_profiles], ["Query_ID", "Duration", "Query"]
+
+    def _show_profile(self, show):
+        query_id = int(show.args["query"].name) if show.args.get("query") else None
+        for query_profile in reversed(self.query_profiles):
+            if query_id is None or query_profile.query_id == query_id:
+                return [(status, "%.6f" % duration) for status, duration in query_profile.get_phases()], \
+                       ["Status", "Duration"]
+        return [], ["Status", "Duration"]
+
+    def _show_processlist(self, show):
+        is_all_users = self.identity_provider.has_permission(self.username, "process")
+        rows, now = [], time.time()
+        for connection_id, connection in sorted((self.connections or {}).items()):
+            session = connection.session
+            if not isinstance(session, ServerSession) or (not is_all_users and session.username != self.username):
+                continue
+            rows.append(session.get_process_info(connection_id, connection, now, bool(show.args.get("full"))))
+        return rows, ["Id", "User", "Host", "db", "Command", "Time", "State", "Info", "Memory_used", "Memory_peak",
+                      "Session_memory"]
+
+    def get_process_info(self, connection_id, connection, now, is_full=False):
+        try:
+            peername = connection.stream.writer.get_extra_info("peername")
+            host = "%s:%s" % (peername[0], peername[1]) if peername else ""
+        except Exception:
+            host = ""
+        query_memory, query_sql = self.query_memory, self.query_sql
+        memory_used, memory_peak = (query_memory.measure(), query_memory.peak) if query_memory is not None else (0, 0)
+        if query_sql and not is_full:
+            query_sql = query_sql[:100]
+        return (connection_id, self.username, host, self.database, "Query" if query_sql else "Sleep",
+                int(now - self.query_time), self.query_state or "", query_sql, memory_used, memory_peak,
+                self.get_session_memory())
+
+    def get_session_memory(self, exclude_names=None):
+        return sum(get_collection_size(collection, exclude_names)
+                   for collection in self.executer_context.get_memory_collections())
+
+    def check_session_memory(self, table_name, datas):
+        memory_limit = self.identity_provider.get_memory_limit(self.username)
+        if memory_limit <= 0:
+            return
+        used = self.get_session_memory({"--." + table_name}) + get_datas_size(datas)
+        if used > memory_limit:
+            raise MemoryLimitExceeded(used, memory_limit)
+
+    def check_query_memory(self):
+        if self.query_memory is not None:
+            return self.query_memory.check()
+        return 0
+
+    def _show_status(self, show):
+        result_cache_stats = self.result_cache.get_stats()
+        rows = [("Result_cache_" + key, str(value)) for key, value in result_cache_stats.items()]
+        if self.plan_cache is not None:
+            rows.extend([("Plan_cache_" + key, str(value)) for key, value in self.plan_cache.get_stats().items()])
+        rows.extend([("Catalog_" + key, str(value)) for key, value in self.catalog.current().get_stats().items()])
+        if self.query_scheduler:
+            rows.extend([("Scheduler_" + key, str(value)) for key, value in self.query_scheduler.get_stats().items()])
+        if self.thread_pool_executor:
+            rows.append(("Executor_threads", str(len(self.thread_pool_executor._threads))))
+        database_manager = self.executer_context.engine.manager.database_manager
+        if hasattr(database_manager, "get_stats"):
+            for driver, driver_stats in database_manager.get_stats().items():
+                rows.extend([("Database_drivers_%s{driver=\"%s\"}" % (key, driver), str(value))
+                             for key, value in driver_stats.items()])
+        if hasattr(database_manager, "get_pool_stats"):
+            for database_name, pool_stats in sorted(database_manager.get_pool_stats().items()):
+                rows.extend([("Database_pool_%s{database=\"%s\"}" % (key, database_name), str(value))
+                             for key, value in pool_stats.items()])
+        if self.metrics:
+            rows.extend(self.metrics.get_status())
+        like = show.text("like")
+        if like:
+            rows = [(k, v) for k, v in rows if like_to_regex(like).match(k)]
+        return rows, ["Variable_name", "Value"]
+
     async def _static_query_interceptor(self, expression):
         try:
             if isinstance(expression, sqlglot_expressions.Select) and \
@@ -369,47 +576,208 @@ class ServerSession(Session):
                 and not (isinstance(expression, sqlglot_expressions.Alias) and expression.args["this"].name.lower() == "import"):
             if sql.lower().startswith("flush"):
                 await self.loop.run_in_executor(self.thread_pool_executor, self.identity_provider.load_users)
+                self.table_script_cache.clear()
+                self.result_cache.clear()
+                if self.plan_cache is not None:
+                    self.plan_cache.clear()
+                if self.process_query_executor:
+                    self.process_query_executor.reload()
                 await self.loop.run_in_executor(self.thread_pool_executor, Database.scan_databases,
-                                                self.config_path, self.executer_context.engine, self.databases)
-                return [(database.name, table.name, table.filename) for database in self.databases.values()
+                                                self.config_path, self.executer_context.engine, self.catalog,
+                                                self.is_scan_database, self.table_script_cache, True, None, True)
+                return [(database.name, table.name, table.filename) for database in self.catalog.current().databases.values()
                         for table in database.tables], ["database", "table", "filename"]
             return [], []
         if "performance_schema" in sql:
             return [], []
+        self.finish_sending()
         start_time = time.time()
+        ticket = None
         try:
             self.execute_index += 1
             get_logger().info("session[%d-%d] query SQL: %s", id(self), self.execute_index, sql.replace("\n", " "))
-            result = await self.loop.run_in_executor(self.thread_pool_executor, self.execute_query, expression, start_time)
+            self.catalog_snapshot = self.catalog.current()
+            database_name = self.parse_query_database(expression)
+            query_profile = QueryProfile(self.execute_index, sql) if self.variables.get("profiling") else None
+            if query_profile is not None:
+                query_profile.add("parsing", self.query_parse_time)
+            self.query_profile = query_profile
+            self.query_sql, self.query_time = sql, start_time
+            if self.query_scheduler:
+                self.query_state = "waiting for scheduler"
+                ticket = await self.acquire_scheduler(expression, database_name)
+                if query_profile is not None:
+                    query_profile.lap("waiting for scheduler")
+            query_canceller = QueryCanceller(self.parse_query_timeout(expression))
+            self.query_canceller = query_canceller
+            self.query_memory = QueryMemoryAccount(self.identity_provider.get_memory_limit(self.username),
+                                                   query_canceller)
+            self.query_state = "executing"
+            table_statistics = self.table_statistics = []
+            result_stream = None
+            if self.process_query_executor and self.process_query_executor.is_executable(self, expression):
+                future = asyncio.ensure_future(self.process_query_executor.execute_query(self, expression, start_time,
+                                                                                         query_canceller.timeout,
+                                                                                         query_profile))
+            else:
+                streaming_batch = self.variables.get("streaming_batch")
+                if streaming_batch and streaming_batch > 0 and isinstance(expression, (sqlglot_expressions.Select,
+                                                                                       sqlglot_expressions.Union)) \
+                        and not expression.args.get("into"):
+                    result_stream = ResultStream(self.loop, streaming_batch)
+                    future = self.loop.run_in_executor(self.thread_pool_executor, self.execute_stream_query,
+                                                       expression, start_time, result_stream)
+                else:
+                    future = self.loop.run_in_executor(self.thread_pool_executor, self.execute_query,
+                                                       expression, start_time)
+            future.add_done_callback(lambda f, d=database_name, t=ticket, c=query_canceller, r=result_stream,
+                                            s=start_time, p=query_profile, n=self.catalog_snapshot, a=table_statistics:
+                                     self.finish_query(f, d, t, c, r, s, p, n, a))
+            ticket = None
+            try:
+                if result_stream is not None:
+                    result = await result_stream.result()
+                else:
+                    result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                query_canceller.cancel()
+                future.add_done_callback(lambda f: close_result(f.result())
+                                         if not f.cancelled() and f.exception() is None else None)
+                raise
             if isinstance(result, Exception):
                 raise result
+            self.sending_query = (self.execute_index, start_time)
             return result
         finally:
-            get_logger().info("session[%d-%d] query SQL finish %.2fms", id(self), self.execute_index, (time.time() - start_time) * 1000)
+            if ticket is not None:
+                self.query_scheduler.release(ticket)
+            get_logger().info("session[%d-%d] query SQL executed %.2fms", id(self), self.execute_index, (time.time() - start_time) * 1000)
+
+    def finish_sending(self):
+        if self.sending_query is None:
+            return
+        execute_index, start_time = self.sending_query
+        self.sending_query = None
+        get_logger().info("session[%d-%d] query SQL finish %.2fms", id(self), execute_index, (time.time() - start_time) * 1000)
+
+    def finish_query(self, future, database_name, ticket, query_canceller, result_stream, start_time,
+                     query_profile=None, catalog_snapshot=None, table_statistics=None):
+        query_canceller.close()
+        if self.query_canceller is query_canceller:
+            self.query_canceller = None
+            self.query_memory = None
+            self.query_sql, self.query_state, self.query_time = None, None, time.time()
+        if catalog_snapshot is not None and self.catalog_snapshot is catalog_snapshot:
+            self.catalog_snapshot = None
+        if query_profile is not None:
+            query_profile.lap("sending" if result_stream is not None else "end")
+            if self.query_profile is query_profile:
+                self.query_profile = None
+            self.query_profiles.append(query_profile)
+            while len(self.query_profiles) > max(int(self.variables.get("profiling_history_size")), 0):
+                self.query_profiles.popleft()
+        if ticket is not None:
+            self.query_scheduler.release(ticket)
+        error = future.exception() if not future.cancelled() else asyncio.CancelledError()
+        if not self.metrics:
+            return
+        try:
+            if result_stream is not None:
+                rows, bytes = result_stream.row_count, result_stream.bytes
+            elif error is None and isinstance(future.result(), tuple):
+                result_rows = future.result()[0]
+                rows, bytes = len(result_rows), get_rows_bytes(result_rows)
+            else:
+                rows, bytes = 0, 0
+            execute_start_time = ticket.start_time if ticket is not None else start_time
+            self.metrics.observe_query(database_name, self.username,
+                                       "ok" if error is None else ("interrupted" if isinstance(error, (
+                                           QueryInterrupted, asyncio.CancelledError)) else "error"),
+                                       execute_start_time - start_time, time.time() - execute_start_time,
+                                       rows, bytes)
+            for database_name, table_name, execute_time, table_rows, cached in (table_statistics or []):
+                self.metrics.observe_table(database_name, table_name, execute_time, table_rows, cached)
+        except Exception as e:
+            get_logger().warning("session[%d-%d] query metrics error: %s", id(self), self.execute_index, e)
+
+    async def kill(self, sql):
+        matched = re.match(r"^\s*kill\s+(query\s+|connection\s+)?(\d+)\s*;?\s*$", sql, re.I)
+        if not matched:
+            raise MysqlError("You have an error in your SQL syntax near '%s'" % sql, code=ErrorCode.PARSE_ERROR)
+        connection_id = int(matched.group(2))
+        connection = self.connections.get(connection_id) if self.connections else None
+        if connection is None or not isinstance(connection.session, ServerSession):
+            raise MysqlError("Unknown thread id: %d" % connection_id, code=ER_NO_SUCH_THREAD)
+        session = connection.session
+        if session.username != self.username and not self.identity_provider.has_permission(self.username, "kill"):
+            raise MysqlError("You are not owner of thread %d" % connection_id, code=ER_KILL_DENIED_ERROR)
+        get_logger().info("session[%d-%d] kill %s", id(self), self.execute_index, matched.group(0).strip())
+        if session.query_canceller is not None:
+            session.query_canceller.cancel()
+        if not matched.group(1) or matched.group(1).strip().lower() != "query":
+            connection.stream.writer.close()
+        return [], []
+
+    async def acquire_scheduler(self, expression, database_name):
+        priority = self.variables.get("query_priority")
+        priority = PRIORITY_NAMES[priority.lower()] if priority and priority.lower() in PRIORITY_NAMES \
+            else self.parse_query_priority(expression)
+        executor_wait_timeout = self.variables.values.get("wait_timeout") or self.executor_wait_timeout
+        return await self.query_scheduler.acquire(self.username, database_name, priority,
+                                                  self.identity_provider.get_concurrency(self.username),
+                                                  self.identity_provider.get_database_concurrency(database_name),
+                                                  int(executor_wait_timeout))
 
-    def execute_query(self, expression, start_time):
+    def execute_stream_query(self, expression, start_time, result_stream):
+        try:
+            self.execute_query(expression, start_time, result_stream)
+        except Exception as e:
+            result_stream.finish(e)
+        else:
+            result_stream.finish()
+
+    def execute_query(self, expression, start_time, result_stream=None):
         executor_wait_timeout = self.variables.values.get("wait_timeout") or self.executor_wait_timeout
         if start_time + int(executor_wait_timeout) <= time.time():
             raise TimeoutError("query execute wait timeout")
+        if self.query_profile is not None:
+            self.query_profile.lap("waiting for executor")
 
         if (expression.args.get("into") or isinstance(expression, sqlglot_expressions.Use) or
                 (isinstance(expression, sqlglot_expressions.Alias) and expression.args["this"].name.lower() == "import")):
             with self.executer_context.present() as executer_context:
                 executer_context.session = self
+                executer_context.executor.canceller = self.query_canceller
                 try:
                     executer_context.execute_expression(expression)
                 finally:
+                    executer_context.executor.canceller = None
                     executer_context.session = None
             return [], []
 
         with self.executer_context.context(self) as executer_context:
+            if self.query_memory is not None:
+                self.query_memory.attach(executer_context.memory_database_collection)
+            is_cacheable = isinstance(expression, (sqlglot_expressions.Select, sqlglot_expressions.Union))
             executer_context.execting_primary_tables = self.parse_primary_tables(expression, defaultdict(list))
-            if executer_context.execting_primary_tables:
-                self.execute_tables(executer_context, executer_context.execting_primary_tables,
-                                    self.parse_primary_variable_sqls(expression))
             joins_tables = self.parse_join_tables(expression, defaultdict(list))
+            tables, variable_sqls = dict(executer_context.execting_primary_tables), \
+                self.parse_primary_variable_sqls(expression)
+            joins_variable_sqls, joins_key_columns, deferred_joins_tables = None, None, {}
             if joins_tables:
-                self.execute_tables(executer_context, joins_tables, self.parse_joins_variable_sqls(expression))
+                joins_variable_sqls = self.parse_joins_variable_sqls(expression)
+                joins_key_columns = self.parse_joins_key_columns(executer_context, expression)
+                for key, table_expressions in joins_tables.items():
+                    if key in tables or key in joins_key_columns:
+                        deferred_joins_tables[key] = table_expressions
+                    else:
+                        tables[key] = table_expressions
+                        variable_sqls[key] = joins_variable_sqls.get(key) or []
+            if tables:
+                self.execute_tables(executer_context, tables, variable_sqls, is_cacheable)
+            if deferred_joins_tables:
+                self.execute_tables(executer_context, deferred_joins_tables, joins_variable_sqls, is_cacheable,
+                                    self.parse_joins_keys(executer_context, joins_key_columns))
 
             if isinstance(expression, (sqlglot_expressions.Insert, sqlglot_expressions.Update, sqlglot_expressions.Delete)):
                 database_name, table_name = self.parse_insert_update_delete_table(expression)
@@ -424,33 +792,53 @@ class ServerSession(Session):
                 if (database_name is None or database_name in self.databases) and table_name:
                     executer_context.rollback_memory_datas(table_name)
                 executer_context.execute_expression(expression)
+                self.check_query_memory()
                 if (database_name is None or database_name in self.databases) and table_name:
                     datas = executer_context.pop_memory_datas(table_name)
                     if datas:
+                        self.check_session_memory(table_name, datas)
                         self.executer_context.commit_memory_datas(table_name, datas)
                 return [], []
 
             collection_name = "__session_execute_%d_%d" % (id(self), self.execute_index)
-            executer_context.execute_expression(expression, "--." + collection_name)
+            if result_stream is not None:
+                executer_context.memory_database_collection["--." + collection_name] = ResultStreamDatas(result_stream,
+                                                                                                         executer_context)
+                try:
+                    executer_context.execute_expression(expression, "--." + collection_name,
+                                                        result_stream.batch_size if self.is_batchable(expression) else 0)
+                finally:
+                    executer_context.memory_database_collection.remove("--." + collection_name)
+                return [], []
+            query_memory_limit = int(self.variables.values.get("query_memory_limit") or 0) * 1024 * 1024
+            if self.query_memory is not None and self.query_memory.limit > 0:
+                remaining_memory = max(self.query_memory.limit - self.check_query_memory(), 1)
+                query_memory_limit = min(query_memory_limit, remaining_memory) if query_memory_limit > 0 \
+                    else remaining_memory
+            if self.memory_budget is not None and (self.memory_budget.limit > 0 or query_memory_limit > 0) \
+                    and isinstance(expression, (sqlglot_expressions.Select, sqlglot_expressions.Union)):
+                spill_datas = SpillDatas(executer_context, self.memory_budget, query_memory_limit, self.spill_path)
+                executer_context.memory_database_collection["--." + collection_name] = spill_datas
+                try:
+                    executer_context.execute_expression(expression, "--." + collection_name,
+                                                        SPILL_BATCH_SIZE if self.is_batchable(expression) else 0)
+                    rows, columns = spill_datas.result(self.thread_pool_executor)
+                finally:
+                    executer_context.memory_database_collection.remove("--." + collection_name)
+                    spill_datas.close()
+                if self.query_profile is not None:
+                    self.query_profile.lap("formatting")
+                return rows, columns
+            output_schema = executer_context.execute_expression(expression, "--." + collection_name)
+            self.check_query_memory()
             datas = executer_context.pop_memory_datas(collection_name)
             if not datas:
                 return [], []
-            keys = list(datas[0].keys())
-
-            def format_value(value):
-                if value is None:
-                    return value
-                if isinstance(value, datetime.datetime):
-                    return datetime.datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
-                if isinstance(value, SQL_COMMON_TYPES):
-                    return value
-                if isinstance(value, SQL_COMPLICACY_TYPES):
-                    return json.dumps(value, default=str, ensure_ascii=False)
-                return str(value)
-            for i in range(len(datas)):
-                data = datas[i]
-                datas[i] = tuple(format_value(data[key]) for key in keys)
-            return datas, keys
+            encoder = ResultEncoder(list(datas[0].keys()), output_schema)
+            rows = encoder.encode(datas)
+            if self.query_profile is not None:
+                self.query_profile.lap("formatting")
+            return rows, encoder.columns
 
     async def schema(self):
         user_databases = await self.identity_provider.get_databases(self.username)
@@ -463,7 +851,8 @@ class ServerSession(Session):
         await super(ServerSession, self).use(database)
         self.executer_context.memory_database_collection.clear()
 
-    def execute_tables(self, executer_context, tables, variable_sqls):
+    def execute_tables(self, executer_context, tables, variable_sqls, is_cacheable=False, joins_keys=None):
+        table_executes = []
         for (database_name, table_name), table_expressions in tables.items():
             database = self.databases[database_name or self.database] if database_name or self.database else None
             if not database:
@@ -471,21 +860,194 @@ class ServerSession(Session):
             table = database.get_table(table_name)
             if not table:
                 continue
-            with Executor(executer_context.engine.manager, executer_context.executor.session_config.session(), executer_context.executor) as executor:
-                table_variable_sqls = variable_sqls.get((database_name, table_name))
-                if table_variable_sqls:
-                    executor.run("session[%d-%d]" % (id(self), self.execute_index),
-                                 [SqlSegment(table_variable_sqls[i], i + 1) for i in range(len(table_variable_sqls))])
-                    executor.execute()
-
-                sql_parser = FileParser(table.filename)
-                sqls = sql_parser.load()
-                executor.run("session[%s-%d]%s" % (id(self), self.execute_index, table.filename), sqls)
-                executor.execute()
+            table_prefix = "%s.%s: " % (database.name, table.name)
+            materialized_snapshot = self.materialized_store.get(database.name, table.name) \
+                if self.materialized_store is not None and table.options.get("materialized") else None
+            if materialized_snapshot is not None:
+                table_executes.append((self.execute_materialized_table, (database, table, table_prefix,
+                                                                         materialized_snapshot)))
+            else:
+                table_variable_sqls = list(variable_sqls.get((database_name, table_name)) or [])
+                table_columns = self.parse_table_columns(table, table_expressions) \
+                    if table.options.get("projection", True) else None
+                if table_columns:
+                    table_variable_sqls.append(("columns", ",".join(table_columns)))
+                join_keys = joins_keys.get((database_name, table_name)) if joins_keys else None
+                if join_keys and table.filename and self.table_script_cache.is_referenced(table.filename, join_keys[0]):
+                    table_executes.append((self.execute_join_table, (database, table, table_prefix, table_variable_sqls,
+                                                                     table_columns, is_cacheable, join_keys)))
+                else:
+                    table_executes.append((self.execute_table, (database, table, table_prefix, table_variable_sqls,
+                                                                table_columns, is_cacheable)))
 
             for table_expression in table_expressions:
                 table_expression.args["db"] = None
 
+        table_parallelism = int(executer_context.get_variable("table_parallelism", TABLE_PARALLELISM) or 1)
+        if len(table_executes) <= 1 or table_parallelism <= 1 or self.table_thread_pool_executor is None:
+            for execute, args in table_executes:
+                execute(executer_context, *args)
+            return
+
+        query_memory = self.query_memory
+
+        def execute_in_context(execute, args):
+            table_context = executer_context.table_context()
+            if query_memory is not None:
+                query_memory.attach(table_context.memory_database_collection)
+            try:
+                with table_context:
+                    execute(table_context, *args)
+            finally:
+                if query_memory is not None:
+                    query_memory.detach(table_context.memory_database_collection)
+            return table_context
+
+        pending_indexes, futures, table_contexts = deque(range(len(table_executes))), {}, {}
+        while pending_indexes or futures:
+            while pending_indexes and len(futures) < table_parallelism:
+                index = pending_indexes.popleft()
+                futures[self.table_thread_pool_executor.submit(execute_in_context, *table_executes[index])] = index
+            done_futures, _ = wait_futures(list(futures), return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                index = futures.pop(future)
+                try:
+                    table_context = future.result()
+                except Exception:
+                    for running_future in futures:
+                        running_future.cancel()
+                    if self.query_canceller is not None:
+                        self.query_canceller.cancel("error")
+                    raise
+                output_name = "--." + table_executes[index][1][1].name
+                datas = dict.get(table_context.memory_database_collection, output_name)
+                if datas is not None:
+                    executer_context.memory_database_collection[output_name] = datas
+                table_contexts[index] = table_context
+        if executer_context.query_profile is not None:
+            for index in sorted(table_contexts):
+                executer_context.query_profile.extend(table_contexts[index].query_profile.get_phases())
+
+    def execute_materialized_table(self, executer_context, database, table, table_prefix, materialized_snapshot):
+        executer_context.memory_database_collection["--." + table.name] = CopyOnWriteDatas(materialized_snapshot.datas)
+        if executer_context.query_profile is not None:
+            executer_context.query_profile.lap(table_prefix + "materialized snapshot")
+        self.table_statistics.append((database.name, table.name, 0, len(materialized_snapshot.datas), True))
+        return materialized_snapshot.datas
+
+    def execute_join_table(self, executer_context, database, table, table_prefix, table_variable_sqls, table_columns,
+                           is_cacheable, join_keys):
+        variable_name, values, join_batch = join_keys
+        datas = []
+        for i in range(0, len(values), join_batch):
+            if executer_context.memory_database_collection.get("--." + table.name) is not None:
+                executer_context.memory_database_collection.remove("--." + table.name)
+            batch_datas = self.execute_table(executer_context, database, table, table_prefix, table_variable_sqls,
+                                             table_columns, is_cacheable, {variable_name: values[i: i + join_batch]})
+            if batch_datas:
+                datas.extend(batch_datas)
+        executer_context.memory_database_collection["--." + table.name] = datas
+
+    def execute_table(self, executer_context, database, table, table_prefix, table_variable_sqls, table_columns,
+                      is_cacheable=False, env_variables=None):
+        with CancellableExecutor(executer_context.engine.manager, executer_context.executor.session_config.session(),
+                                 executer_context.executor) as executor:
+            if table_columns:
+                executor.projection = (table.name, set(table_columns) | set(table.primary_keys or []))
+            if table_variable_sqls:
+                variable_sqls = [sql for sql in table_variable_sqls if isinstance(sql, str)]
+                if variable_sqls:
+                    executor.run("session[%d-%d]" % (id(self), self.execute_index),
+                                 [SqlSegment(variable_sqls[i], i + 1) for i in range(len(variable_sqls))])
+                    executor.execute()
+                executor.env_variables.update({"@" + sql[0]: sql[1] for sql in table_variable_sqls
+                                               if isinstance(sql, tuple)})
+            if env_variables:
+                executor.env_variables.update(env_variables)
+            query_profile = executer_context.query_profile
+            if query_profile is not None and (table_variable_sqls or env_variables):
+                query_profile.lap(table_prefix + "priming variables")
+
+            table_start_time, cached = time.time(), False
+            cache_ttl = table.options.get("cache_ttl") if is_cacheable and self.result_cache.enabled else None
+            if cache_ttl:
+                cache_key = self.result_cache.build_key(database.name, table.name,
+                                                        self.table_script_cache.get_version(table.filename),
+                                                        executor.env_variables)
+                datas = self.result_cache.get(cache_key)
+                if datas is not None:
+                    executer_context.memory_database_collection["--." + table.name] = CopyOnWriteDatas(datas)
+                    cached = True
+                    if query_profile is not None:
+                        query_profile.lap(table_prefix + "result cache hit")
+                else:
+                    self.execute_table_script(executor, table, table_prefix, query_profile)
+                    datas = executer_context.memory_database_collection.get("--." + table.name)
+                    if datas is not None:
+                        self.result_cache.set(cache_key, compact_datas(datas[:]) if table.options.get("columnar")
+                                              else datas[:], float(cache_ttl))
+            else:
+                self.execute_table_script(executor, table, table_prefix, query_profile)
+            datas = executer_context.memory_database_collection.get("--." + table.name)
+            self.table_statistics.append((database.name, table.name, time.time() - table_start_time,
+                                          len(datas) if datas is not None else 0, cached))
+        self.check_query_memory()
+        return datas
+
+    def execute_table_script(self, executor, table, table_prefix, query_profile=None):
+        sqls = self.table_script_cache.load(table.filename)
+        if query_profile is not None:
+            query_profile.lap(table_prefix + "loading table script")
+        executor.run("session[%s-%d]%s" % (id(self), self.execute_index, table.filename), sqls)
+        if query_profile is not None:
+            query_profile.lap(table_prefix + "compiling")
+            for runner in executor.runners:
+                query_profile.attach(runner, table_prefix)
+        executor.execute()
+        if query_profile is not None:
+            query_profile.lap(table_prefix + "executing")
+
+    def parse_table_columns(self, table, table_expressions):
+        columns = set()
+        root_expression = table_expressions[0].root()
+        for table_expression in root_expression.find_all(sqlglot_expressions.Table):
+            if table_expression.name != table_expressions[0].name:
+                continue
+            select_expression = table_expression.parent
+            while select_expression is not None and not isinstance(select_expression, sqlglot_expressions.Select):
+                select_expression = select_expression.parent
+            if select_expression is None:
+                return None
+            table_alias = table_expression.alias_or_name
+            for column_expression in select_expression.args.get("expressions") or []:
+                if isinstance(column_expression, sqlglot_expressions.Star):
+                    return None
+                if isinstance(column_expression, sqlglot_expressions.Column) \
+                        and isinstance(column_expression.args.get("this"), sqlglot_expressions.Star) \
+                        and column_expression.table == table_alias:
+                    return None
+            scope_aliases = {scope_table_expression.alias_or_name for scope_table_expression
+                             in select_expression.find_all(sqlglot_expressions.Table)}
+            for column_expression in select_expression.find_all(sqlglot_expressions.Column):
+                if isinstance(column_expression.args.get("this"), sqlglot_expressions.Star):
+                    continue
+                if not column_expression.table or column_expression.table == table_alias:
+                    columns.add(column_expression.name)
+                elif column_expression.text("db") == table_alias or column_expression.table not in scope_aliases:
+                    columns.add(column_expression.table)
+        if table.schema:
+            return [column_name for column_name in table.schema if column_name in columns]
+        return sorted(columns)
+
+    def has_materialized_tables(self, expression):
+        if self.materialized_store is None:
+            return False
+        for table_expression in expression.find_all(sqlglot_expressions.Table):
+            database_name = table_expression.args["db"].name if table_expression.args.get("db") else self.database
+            if database_name and self.materialized_store.get(database_name, table_expression.name) is not None:
+                return True
+        return False
+
     def parse_primary_tables(self, expression, tables):
         if isinstance(expression, sqlglot_expressions.Select):
             from_expression = expression.args.get("from")
@@ -542,37 +1104,6 @@ class ServerSession(Session):
             return defaultdict(list)
         primary_variable_sqls = defaultdict(list)
 
-        def parse_primary_condition(database_name, table_name, table_alias, condition_expression):
-            if isinstance(condition_expression, sqlglot_expressions.And):
-                parse_primary_condition(database_name, table_name, table_alias, condition_expression.args.get("this"))
-                parse_primary_condition(database_name, table_name, table_alias, condition_expression.args.get("expression"))
-            elif isinstance(condition_expression, sqlglot_expressions.EQ):
-                if not isinstance(condition_expression.args["this"], sqlglot_expressions.Column):
-                    return
-                if self.has_column(condition_expression.args["expression"]):
-                    return
-                if "table" in condition_expression.args["this"].args:
-                    condition_table_name = condition_expression.args["this"].args["table"].name
-                    if condition_table_name and condition_table_name != table_alias:
-                        return
-                name = condition_expression.args["this"].name
-                primary_variable_sqls[(database_name, table_name)].append(
-                    "SELECT %s as %s INTO @%s" % (self.generate_sql(condition_expression.args["expression"]), name, name))
-            elif isinstance(condition_expression, (sqlglot_expressions.GT, sqlglot_expressions.GTE,
-                                                   sqlglot_expressions.LT, sqlglot_expressions.LTE,
-                                                   sqlglot_expressions.NEQ)):
-                if not isinstance(condition_expression.args["this"], sqlglot_expressions.Column):
-                    return
-                if self.has_column(condition_expression.args["expression"]):
-                    return
-                if "table" in condition_expression.args["this"].args:
-                    condition_table_name = condition_expression.args["this"].args["table"].name
-                    if condition_table_name and condition_table_name != table_alias:
-                        return
-                name = "%s__%s" % (condition_expression.args["this"].name, condition_expression.key.lower())
-                primary_variable_sqls[(database_name, table_name)].append(
-                    "SELECT %s as %s INTO @%s" % (self.generate_sql(condition_expression.args["expression"]), name, name))
-
         database_name, table_name, table_alias = None, None, None
         from_expression = expression.args.get("from")
         if from_expression and from_expression.args.get("expressions"):
@@ -586,7 +1117,8 @@ class ServerSession(Session):
 
         where_expression = expression.args.get("where")
         if where_expression:
-            parse_primary_condition(database_name, table_name, table_alias, where_expression.args["this"])
+            self.parse_condition_variable_sqls(primary_variable_sqls[(database_name, table_name)], table_alias,
+                                               where_expression.args["this"])
 
         order_expression = expression.args.get("order")
         if order_expression:
@@ -600,8 +1132,7 @@ class ServerSession(Session):
                         continue
                 order_bys.append(self.generate_sql(order_expression))
             if order_bys:
-                primary_variable_sqls[(database_name, table_name)].append(
-                    "SELECT '%s' as %s INTO @%s" % (",".join(order_bys), "order_by", "order_by"))
+                primary_variable_sqls[(database_name, table_name)].append(("order_by", ",".join(order_bys)))
 
         if expression.args.get("offset"):
             offset_expression, limit_expression = expression.args.get("limit"), expression.args.get("offset")
@@ -609,11 +1140,10 @@ class ServerSession(Session):
             offset_expression, limit_expression = None, expression.args.get("limit")
         if limit_expression:
             primary_variable_sqls[(database_name, table_name)].append(
-                "SELECT %d as %s INTO @%s" % (max(int(offset_expression.args["expression"].args["this"]), 0)
-                                              if offset_expression else 0, "limit_offset", "limit_offset"))
+                ("limit_offset", max(int(offset_expression.args["expression"].args["this"]), 0)
+                 if offset_expression else 0))
             primary_variable_sqls[(database_name, table_name)].append(
-                "SELECT %d as %s INTO @%s" % (max(int(limit_expression.args["expression"].args["this"]), 1),
-                                              "limit_count", "limit_count"))
+                ("limit_count", max(int(limit_expression.args["expression"].args["this"]), 1)))
         return primary_variable_sqls
 
     def parse_joins_variable_sqls(self, expression):
@@ -624,49 +1154,257 @@ class ServerSession(Session):
             return defaultdict(list)
         joins_variable_sqls = defaultdict(list)
 
-        def parse_on_condition(database_name, table_name, table_alias, condition_expression):
-            if isinstance(condition_expression, sqlglot_expressions.And):
-                parse_on_condition(database_name, table_name, table_alias, condition_expression.args.get("this"))
-                parse_on_condition(database_name, table_name, table_alias, condition_expression.args.get("expression"))
-            elif isinstance(condition_expression, sqlglot_expressions.EQ):
-                if not isinstance(condition_expression.args["this"], sqlglot_expressions.Column):
-                    return
-                if self.has_column(condition_expression.args["expression"]):
-                    return
-                if "table" in condition_expression.args["this"].args:
-                    condition_table_name = condition_expression.args["this"].args["table"].name
-                    if condition_table_name and condition_table_name != table_alias:
-                        return
-                name = condition_expression.args["this"].name
-                joins_variable_sqls[(database_name, table_name)].append(
-                    "SELECT %s as %s INTO @%s" % (self.generate_sql(condition_expression.args["expression"]), name, name))
-            elif isinstance(condition_expression, (sqlglot_expressions.GT, sqlglot_expressions.GTE,
-                                                   sqlglot_expressions.LT, sqlglot_expressions.LTE,
-                                                   sqlglot_expressions.NEQ)):
-                if not isinstance(condition_expression.args["this"], sqlglot_expressions.Column):
-                    return
-                if self.has_column(condition_expression.args["expression"]):
-                    return
-                if "table" in condition_expression.args["this"].args:
-                    condition_table_name = condition_expression.args["this"].args["table"].name
-                    if condition_table_name and condition_table_name != table_alias:
-                        return
-                name = "%s__%s" % (condition_expression.args["this"].name, condition_expression.key.lower())
-                joins_variable_sqls[(database_name, table_name)].append(
-                    "SELECT %s as %s INTO @%s" % (self.generate_sql(condition_expression.args["expression"]), name, name))
-
         for join_expression in joins_expression:
             table_expression = join_expression.args["this"]
             if not isinstance(table_expression, sqlglot_expressions.Table):
                 continue
             if not join_expression.args.get("on"):
                 continue
-            parse_on_condition(table_expression.args["db"].name if table_expression.args.get("db") else None,
-                               table_expression.args["this"].name, table_expression.args["alias"].name
-                               if table_expression.args.get("alias") else table_expression.args["this"].name,
-                               join_expression.args["on"])
+            database_name, table_name = (table_expression.args["db"].name if table_expression.args.get("db") else None,
+                                         table_expression.args["this"].name)
+            self.parse_condition_variable_sqls(joins_variable_sqls[(database_name, table_name)],
+                                               table_expression.args["alias"].name if table_expression.args.get("alias")
+                                               else table_name, join_expression.args["on"])
         return joins_variable_sqls
 
+    def parse_joins_key_columns(self, executer_context, expression):
+        if not isinstance(expression, sqlglot_expressions.Select) or not expression.args.get("joins") \
+                or not executer_context.execting_primary_tables:
+            return {}
+        join_batch = executer_context.get_variable("join_batch", JOIN_KEY_BATCH_SIZE)
+        if not join_batch or int(join_batch) <= 0:
+            return {}
+        join_batch = int(join_batch)
+        from_expression = expression.args.get("from")
+        if not from_expression or not from_expression.args.get("expressions") \
+                or not isinstance(from_expression.args["expressions"][0], sqlglot_expressions.Table):
+            return {}
+        primary_table_expression = from_expression.args["expressions"][0]
+        if not any(table_name == primary_table_expression.name
+                   for _, table_name in executer_context.execting_primary_tables):
+            return {}
+        primary_alias = primary_table_expression.alias_or_name
+
+        def parse_on_keys(join_alias, condition_expression, join_keys):
+            if isinstance(condition_expression, sqlglot_expressions.Paren):
+                parse_on_keys(join_alias, condition_expression.args.get("this"), join_keys)
+            elif isinstance(condition_expression, sqlglot_expressions.And):
+                parse_on_keys(join_alias, condition_expression.args.get("this"), join_keys)
+                parse_on_keys(join_alias, condition_expression.args.get("expression"), join_keys)
+            elif isinstance(condition_expression, sqlglot_expressions.EQ):
+                left_expression, right_expression = condition_expression.args["this"], condition_expression.args["expression"]
+                if not isinstance(left_expression, sqlglot_expressions.Column) \
+                        or not isinstance(right_expression, sqlglot_expressions.Column):
+                    return
+                if left_expression.table == primary_alias and right_expression.table == join_alias:
+                    left_expression, right_expression = right_expression, left_expression
+                if left_expression.table == join_alias and right_expression.table == primary_alias:
+                    join_keys.append((left_expression.name, right_expression.name))
+
+        joins_key_columns = {}
+        for join_expression in expression.args["joins"]:
+            table_expression = join_expression.args["this"]
+            if not isinstance(table_expression, sqlglot_expressions.Table) or not join_expression.args.get("on"):
+                continue
+            if join_expression.text("side").upper() not in ("", "LEFT") \
+                    or join_expression.text("kind").upper() not in ("", "INNER", "OUTER"):
+                continue
+            if table_expression.name == primary_table_expression.name:
+                continue
+            join_keys = []
+            parse_on_keys(table_expression.alias_or_name, join_expression.args["on"], join_keys)
+            if not join_keys:
+                continue
+            database_name = table_expression.args["db"].name if table_expression.args.get("db") else None
+            database = self.databases.get(database_name or self.database)
+            table = database.get_table(table_expression.name) if database else None
+            if not table or not table.filename \
+                    or not self.table_script_cache.is_referenced(table.filename, "@%s__in" % join_keys[0][0]):
+                continue
+            joins_key_columns[(database_name, table_expression.name)] = (primary_table_expression.name,
+                                                                         join_keys[0][0], join_keys[0][1], join_batch)
+        return joins_key_columns
+
+    def parse_joins_keys(self, executer_context, joins_key_columns):
+        joins_keys = {}
+        for key, (primary_table_name, join_column, primary_column, join_batch) in joins_key_columns.items():
+            primary_datas = executer_context.memory_database_collection.get("--." + primary_table_name)
+            if primary_datas is None:
+                continue
+            values = {}
+            for data in primary_datas:
+                value = data.get(primary_column)
+                if value is None:
+                    continue
+                try:
+                    values[value] = True
+                except TypeError:
+                    values = None
+                    break
+            if values is None or len(values) > join_batch * JOIN_KEY_MAX_BATCHES:
+                continue
+            joins_keys[key] = ("@%s__in" % join_column, list(values), join_batch)
+        return joins_keys
+
+    def parse_condition_column(self, column_expression, table_alias):
+        if not isinstance(column_expression, sqlglot_expressions.Column):
+            return None
+        if "table" in column_expression.args:
+            condition_table_name = column_expression.args["table"].name
+            if condition_table_name and condition_table_name != table_alias:
+                return None
+        return column_expression.name
+
+    def parse_condition_in_values(self, condition_expression, table_alias):
+        while isinstance(condition_expression, sqlglot_expressions.Paren):
+            condition_expression = condition_expression.args.get("this")
+        if isinstance(condition_expression, sqlglot_expressions.Or):
+            left_values = self.parse_condition_in_values(condition_expression.args.get("this"), table_alias)
+            right_values = self.parse_condition_in_values(condition_expression.args.get("expression"), table_alias)
+            if not left_values or not right_values or left_values[0] != right_values[0]:
+                return None
+            return left_values[0], left_values[1] + right_values[1]
+        if isinstance(condition_expression, sqlglot_expressions.EQ):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            if not name or self.has_column(condition_expression.args["expression"]):
+                return None
+            return name, [condition_expression.args["expression"]]
+        if isinstance(condition_expression, sqlglot_expressions.In):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            values = condition_expression.args.get("expressions")
+            if not name or not values or condition_expression.args.get("query") \
+                    or any(self.has_column(value) for value in values):
+                return None
+            return name, list(values)
+        return None
+
+    def append_variable_sql(self, variable_sqls, name, value_expression):
+        is_const, value = get_const_value(value_expression)
+        if is_const:
+            variable_sqls.append((name, value))
+        else:
+            variable_sqls.append("SELECT %s as %s INTO @%s" % (self.generate_sql(value_expression), name, name))
+
+    def parse_condition_variable_sqls(self, variable_sqls, table_alias, condition_expression):
+        if isinstance(condition_expression, sqlglot_expressions.Paren):
+            self.parse_condition_variable_sqls(variable_sqls, table_alias, condition_expression.args.get("this"))
+        elif isinstance(condition_expression, sqlglot_expressions.And):
+            self.parse_condition_variable_sqls(variable_sqls, table_alias, condition_expression.args.get("this"))
+            self.parse_condition_variable_sqls(variable_sqls, table_alias, condition_expression.args.get("expression"))
+        elif isinstance(condition_expression, sqlglot_expressions.EQ):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            if not name or self.has_column(condition_expression.args["expression"]):
+                return
+            self.append_variable_sql(variable_sqls, name, condition_expression.args["expression"])
+        elif isinstance(condition_expression, (sqlglot_expressions.GT, sqlglot_expressions.GTE,
+                                               sqlglot_expressions.LT, sqlglot_expressions.LTE,
+                                               sqlglot_expressions.NEQ)):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            if not name or self.has_column(condition_expression.args["expression"]):
+                return
+            self.append_variable_sql(variable_sqls, "%s__%s" % (name, condition_expression.key.lower()),
+                                     condition_expression.args["expression"])
+        elif isinstance(condition_expression, (sqlglot_expressions.In, sqlglot_expressions.Or)):
+            in_values = self.parse_condition_in_values(condition_expression, table_alias)
+            if not in_values:
+                return
+            name = "%s__in" % in_values[0]
+            is_const, values = get_const_values(in_values[1])
+            if is_const:
+                variable_sqls.append((name, values))
+            else:
+                variable_sqls.append("SELECT convert_array((%s)) as %s INTO @%s"
+                                     % (", ".join([self.generate_sql(value) for value in in_values[1]]), name, name))
+        elif isinstance(condition_expression, sqlglot_expressions.Between):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            if not name or self.has_column(condition_expression.args["low"]) \
+                    or self.has_column(condition_expression.args["high"]):
+                return
+            self.append_variable_sql(variable_sqls, "%s__gte" % name, condition_expression.args["low"])
+            self.append_variable_sql(variable_sqls, "%s__lte" % name, condition_expression.args["high"])
+        elif isinstance(condition_expression, sqlglot_expressions.Is):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            if not name or not isinstance(condition_expression.args["expression"], sqlglot_expressions.Null):
+                return
+            variable_sqls.append(("%s__isnull" % name, True))
+        elif isinstance(condition_expression, sqlglot_expressions.Not):
+            is_expression = condition_expression.args.get("this")
+            if not isinstance(is_expression, sqlglot_expressions.Is) \
+                    or not isinstance(is_expression.args["expression"], sqlglot_expressions.Null):
+                return
+            name = self.parse_condition_column(is_expression.args["this"], table_alias)
+            if not name:
+                return
+            variable_sqls.append(("%s__isnull" % name, False))
+        elif isinstance(condition_expression, sqlglot_expressions.Like):
+            name = self.parse_condition_column(condition_expression.args["this"], table_alias)
+            if not name or self.has_column(condition_expression.args["expression"]):
+                return
+            self.append_variable_sql(variable_sqls, "%s__like" % name, condition_expression.args["expression"])
+            pattern_expression = condition_expression.args["expression"]
+            if not isinstance(pattern_expression, sqlglot_expressions.Literal) or not pattern_expression.is_string:
+                return
+            pattern = pattern_expression.name
+            if len(pattern) < 2 or pattern[-1] != "%" or any(c in pattern[:-1] for c in "%_\\"):
+                return
+            variable_sqls.append(("%s__startswith" % name, pattern[:-1]))
+
+    def parse_query_database(self, expression):
+        for table_expression in expression.find_all(sqlglot_expressions.Table):
+            database_name = table_expression.args["db"].name if table_expression.args.get("db") else None
+            if database_name and database_name in self.databases:
+                return database_name
+        return self.database
+
+    def parse_query_timeout(self, expression):
+        timeout = 0
+        for table_expression in expression.find_all(sqlglot_expressions.Table):
+            database_name = table_expression.args["db"].name if table_expression.args.get("db") else self.database
+            if not database_name or database_name not in self.databases:
+                continue
+            table = self.databases[database_name].get_table(table_expression.args["this"].name)
+            if table and table.options.get("timeout"):
+                timeout = max(timeout, float(table.options["timeout"]))
+        if timeout > 0:
+            return timeout
+        if not isinstance(expression, (sqlglot_expressions.Select, sqlglot_expressions.Union)):
+            return 0
+        max_execution_time = self.variables.get("max_execution_time")
+        return int(max_execution_time) / 1000.0 if max_execution_time else 0
+
+    def parse_query_priority(self, expression):
+        if isinstance(expression, (sqlglot_expressions.Union, sqlglot_expressions.Insert, sqlglot_expressions.Update,
+                                   sqlglot_expressions.Delete)) or expression.args.get("into"):
+            return PRIORITY_LOW
+        if not isinstance(expression, sqlglot_expressions.Select):
+            return PRIORITY_NORMAL
+        if not expression.args.get("from"):
+            return PRIORITY_HIGH
+        if any(expression.args.get(name) for name in ("group", "joins", "distinct", "having")) \
+                or expression.find(sqlglot_expressions.Window, sqlglot_expressions.Subquery):
+            return PRIORITY_LOW
+        where_expression = expression.args.get("where")
+        if where_expression and where_expression.find(sqlglot_expressions.EQ, sqlglot_expressions.In):
+            return PRIORITY_HIGH
+        limit_expression = expression.args.get("limit")
+        if limit_expression and isinstance(limit_expression.args.get("expression"), sqlglot_expressions.Literal) \
+                and limit_expression.args["expression"].name.isdigit() \
+                and int(limit_expression.args["expression"].name) <= 1000:
+            return PRIORITY_HIGH
+        if not where_expression and not limit_expression:
+            return PRIORITY_LOW
+        return PRIORITY_NORMAL
+
+    def is_batchable(self, expression):
+        if not isinstance(expression, sqlglot_expressions.Select):
+            return False
+        if any(expression.args.get(name) for name in ("group", "having", "order", "distinct", "qualify")):
+            return False
+        for select_expression in expression.args.get("expressions") or []:
+            if select_expression.find(sqlglot_expressions.AggFunc, sqlglot_expressions.Window):
+                return False
+        return True
+
     def has_column(self, expression):
         if not isinstance(expression, sqlglot_expressions.Expression):
             return False
@@ -694,9 +1432,13 @@ class Server(MysqlServer):
     origin_parse_table = Compiler.parse_table
     origin_parse_column = Compiler.parse_column
     origin_compile_select_star_column = Compiler.compile_select_star_column
+    origin_compile_insert_into = Compiler.compile_insert_into
+    origin_compile = Compiler.compile
 
     def __init__(self, host=None, port=3306, config_path=".", username=None, password=None,
-                 executor_max_workers=5, executor_wait_timeout=120, is_scan_database=False, is_readonly=True):
+                 executor_max_workers=5, executor_wait_timeout=120, is_scan_database=False, is_readonly=True,
+                 result_cache_size=256, streaming_batch=0, executor_mode="thread", metrics_port=0, reload_interval=0,
+                 scan_manifest=None, memory_limit=0, spill_path=None, metrics_path=None):
         super(Server, self).__init__(session_factory=self.create_session,
                                      identity_provider=UserIdentityProvider(config_path, username, password, is_readonly))
 
@@ -706,40 +1448,110 @@ class Server(MysqlServer):
         self.executor_max_workers = executor_max_workers
         self.executor_wait_timeout = executor_wait_timeout
         self.is_scan_database = is_scan_database
+        self.executor_mode = executor_mode
         self.script_engine = None
         self.thread_pool_executor = None
-        self.databases = {}
+        self.table_thread_pool_executor = None
+        self.process_query_executor = None
+        self.query_scheduler = QueryScheduler(executor_max_workers)
+        self.metrics = Metrics()
+        self.metrics_port = metrics_port
+        self.metrics_path = metrics_path
+        self.metrics_server = None
+        self.catalog = Catalog()
+        self.reload_interval = reload_interval
+        self.scan_manifest = scan_manifest
+        self.config_watcher = None
+        self.materialized_store = MaterializedStore()
+        self.materialized_refresher = None
+        self.memory_budget = MemoryBudget(memory_limit * 1024 * 1024)
+        self.plan_cache = QueryPlanCache()
+        self.spill_path = spill_path
+        self.table_script_cache = TableScriptCache()
+        self.result_cache_size = result_cache_size * 1024 * 1024
+        self.result_cache = ResultCache(self.result_cache_size)
+        self.global_variables = GlobalVariables(dict(SYSTEM_VARIABLES, **{
+            "streaming_batch": (int, streaming_batch, True),
+            "query_priority": (str, "auto", True),
+            "profiling": (bool, False, True),
+            "profiling_history_size": (int, 15, True),
+            "query_memory_limit": (int, 0, True),
+        }))
+
+    async def _client_connected_cb(self, reader, writer):
+        connection_id = self._get_connection_id()
+        connection = ServerConnection(
+            stream=MysqlStream(reader, writer),
+            session=self.session_factory(),
+            server_capabilities=self.capabilities,
+            connection_id=connection_id,
+            identity_provider=self.identity_provider,
+            ssl=self.ssl,
+        )
+        self._connections[connection_id] = connection
+        try:
+            return await connection.start()
+        finally:
+            self._connections.pop(connection_id, None)
 
     def create_session(self, *args, **kwargs):
         if not self.script_engine:
             return None
-        executor = Executor(self.script_engine.manager, self.script_engine.executor.session_config.session(),
-                            self.script_engine.executor)
+        executor = CancellableExecutor(self.script_engine.manager, self.script_engine.executor.session_config.session(),
+                                       self.script_engine.executor)
         return ServerSession(self.config_path, ServerSessionExecuterContext(self.script_engine, executor),
-                             self.identity_provider, self.thread_pool_executor, self.databases,
-                             self.executor_wait_timeout, *args, **kwargs)
-
-    def setup_script_engine(self):
-        if self.script_engine is not None:
-            return
+                             self.identity_provider, self.thread_pool_executor, self.catalog,
+                             self.executor_wait_timeout, *args, is_scan_database=self.is_scan_database,
+                             table_script_cache=self.table_script_cache, result_cache=self.result_cache,
+                             process_query_executor=self.process_query_executor, query_scheduler=self.query_scheduler,
+                             connections=self._connections, metrics=self.metrics,
+                             materialized_store=self.materialized_store, memory_budget=self.memory_budget,
+                             spill_path=self.spill_path, plan_cache=self.plan_cache,
+                             table_thread_pool_executor=self.table_thread_pool_executor,
+                             variables=SessionVariables(self.global_variables), **kwargs)
+
+    @classmethod
+    def create_script_engine(cls):
         register_filters()
-        self.script_engine = ScriptEngine()
-        init_execute_files = self.script_engine.config.load()
-        self.script_engine.config.config_logging()
+        script_engine = ScriptEngine()
+        init_execute_files = script_engine.config.load()
+        script_engine.config.config_logging()
         get_logger().info("server initialization")
-        self.script_engine.config.load_extensions()
-        self.script_engine.manager = TaskerManager(DatabaseManager())
-        self.script_engine.executor = Executor(self.script_engine.manager, self.script_engine.config.session())
+        script_engine.config.load_extensions()
+        script_engine.manager = TaskerManager(DatabaseManager())
+        script_engine.manager.database_manager.configure(script_engine.config.get()["databases"])
+        script_engine.executor = Executor(script_engine.manager, script_engine.config.session())
         if init_execute_files:
-            self.script_engine.executor.run("init", [SqlSegment("execute `%s`" % init_execute_files[i], i + 1)
-                                                     for i in range(len(init_execute_files))])
-            with self.script_engine.executor as executor:
+            script_engine.executor.run("init", [SqlSegment("execute `%s`" % init_execute_files[i], i + 1)
+                                                for i in range(len(init_execute_files))])
+            with script_engine.executor as executor:
                 executor.execute()
+        return script_engine
+
+    def setup_script_engine(self):
+        if self.script_engine is not None:
+            return
+        self.script_engine = self.create_script_engine()
         self.thread_pool_executor = ThreadPoolExecutor(self.executor_max_workers)
+        self.table_thread_pool_executor = ThreadPoolExecutor(self.executor_max_workers,
+                                                             thread_name_prefix="syncany-table")
+        if self.executor_mode == "process":
+            self.process_query_executor = ProcessQueryExecutor(self.executor_max_workers, self.config_path,
+                                                               self.is_scan_database, self.result_cache_size,
+                                                               self.scan_manifest)
         self.identity_provider.load_users()
 
-    async def start_server(self, **kwargs):
-        self.setup_script_engine()
+    @classmethod
+    def install_compiler_hooks(cls, catalog, plan_cache=None):
+        def get_databases():
+            try:
+                executer_context = ExecuterContext.current()
+            except AttributeError:
+                executer_context = None
+            session = getattr(executer_context, "session", None)
+            if session is not None and session.catalog_snapshot is not None:
+                return session.catalog_snapshot.databases
+            return catalog.current().databases
 
         def parse_table(compiler, *args):
             table_info = Server.origin_parse_table(compiler, *args)
@@ -749,8 +1561,9 @@ class Server(MysqlServer):
                 setattr(compiler, "server_schemas", {})
             if not table_info.get("primary_keys"):
                 db_name, table_name = table_info["db"], table_info["name"]
-                if db_name in self.databases:
-                    table = self.databases[db_name].get_table(table_name)
+                databases = get_databases()
+                if db_name in databases:
+                    table = databases[db_name].get_table(table_name)
                     if table is not None and table.primary_keys:
                         table_info["primary_keys"] = table.primary_keys
             compiler.server_schemas[table_info["table_name"]] = table_info
@@ -771,14 +1584,13 @@ class Server(MysqlServer):
                 if len(table_info) <= 1:
                     return column_info
                 db_name, table_name = table_info[0], table_info[1]
-            if db_name not in self.databases:
-                return column_info
-            table_schema = self.databases[db_name].get_table_schema(table_name)
-            if table_schema is None:
+            database = get_databases().get(db_name)
+            if database is None:
                 return column_info
-            if column_info["column_name"] not in table_schema:
+            column_schema = database.get_column_schema(table_name, column_info["column_name"])
+            if column_schema is None:
                 return column_info
-            typing_filter = table_schema[column_info["column_name"]][1]
+            typing_filter = column_schema[1]
             if typing_filter:
                 column_info["typing_filters"] = [typing_filter]
                 if column_info["typing_name"] and "|" not in column_info["typing_name"]:
@@ -806,9 +1618,10 @@ class Server(MysqlServer):
                         for primary_table_db, primary_table_name in executer_context.execting_primary_tables:
                             if primary_table_name == table_name:
                                 db_name = primary_table_db
-            if not db_name or db_name not in self.databases:
+            databases = get_databases()
+            if not db_name or db_name not in databases:
                 return False
-            table_schema = self.databases[db_name].get_table_schema(table_name)
+            table_schema = databases[db_name].get_table_schema(table_name)
             if table_schema is None:
                 return False
             for name, column in table_schema.items():
@@ -828,21 +1641,139 @@ class Server(MysqlServer):
                                                column_info, join_tables)
             return True
 
+        def compile_insert_into(compiler, expression, config, arguments):
+            try:
+                projection = getattr(Executor.current(), "projection", None)
+            except AttributeError:
+                projection = None
+            table_expression, select_expression = expression.args.get("this"), expression.args.get("expression")
+            if projection and isinstance(table_expression, sqlglot_expressions.Table) \
+                    and isinstance(select_expression, sqlglot_expressions.Select) \
+                    and table_expression.text("db") in ("", "--") \
+                    and compiler.mapping.get(table_expression.name, table_expression.name).split("[")[0] == projection[0] \
+                    and not any(select_expression.args.get(key) for key in ("distinct", "group", "having", "windows")):
+                keep_columns = set(projection[1])
+                if select_expression.args.get("order"):
+                    keep_columns.update(column_expression.name for column_expression
+                                        in select_expression.args["order"].find_all(sqlglot_expressions.Column))
+                column_expressions = []
+                for column_expression in select_expression.args.get("expressions") or []:
+                    if isinstance(column_expression, sqlglot_expressions.Alias):
+                        column_alias = compiler.parse_column_alias(column_expression, config, arguments)
+                        if column_alias is None or "pk" in column_alias["typing_options"] \
+                                or column_alias["column_alias"] in keep_columns:
+                            column_expressions.append(column_expression)
+                    elif isinstance(column_expression, sqlglot_expressions.Column) \
+                            and not isinstance(column_expression.args.get("this"), sqlglot_expressions.Star):
+                        column_name = compiler.mapping.get(column_expression.name, column_expression.name)
+                        if column_name.strip("`").split("[")[0] in keep_columns:
+                            column_expressions.append(column_expression)
+                    else:
+                        column_expressions.append(column_expression)
+                if column_expressions and len(column_expressions) < len(select_expression.args["expressions"]):
+                    select_expression.set("expressions", column_expressions)
+            return Server.origin_compile_insert_into(compiler, expression, config, arguments)
+
         Compiler.parse_table = parse_table
         Compiler.parse_column = parse_column
         Compiler.compile_select_star_column = compile_select_star_column
+        Compiler.compile_insert_into = compile_insert_into
+        if plan_cache is not None:
+            Compiler.compile = lambda compiler, sql, arguments: plan_cache.compile_script(compiler, sql, arguments,
+                                                                                         Server.origin_compile)
+
+    def reload_catalog(self):
+        is_users_changed = self.identity_provider.version != self.identity_provider.get_version()
+        if is_users_changed:
+            self.identity_provider.load_users()
+        catalog_snapshot = Database.scan_databases(self.config_path, self.script_engine, self.catalog,
+                                                   self.is_scan_database, self.table_script_cache, False)
+        if (is_users_changed or catalog_snapshot is not None) and self.process_query_executor:
+            self.process_query_executor.reload(False)
+
+    def refresh_materialized_table(self, database_name, table, env_variables=None):
+        executor = Executor(self.script_engine.manager, self.script_engine.executor.session_config.session(),
+                            self.script_engine.executor)
+        with ServerSessionExecuterContext(self.script_engine, executor) as executer_context:
+            with CancellableExecutor(self.script_engine.manager, executor.session_config.session(),
+                                     executor) as table_executor:
+                if env_variables:
+                    table_executor.env_variables.update(env_variables)
+                table_executor.run("materialized[%s.%s]%s" % (database_name, table.name, table.filename),
+                                   self.table_script_cache.load(table.filename))
+                table_executor.execute()
+            return executer_context.memory_database_collection.get("--." + table.name)
+
+    def collect_metrics(self):
+        samples = [("syncany_connections", (), len(self._connections)),
+                   ("syncany_executor_workers", (), self.executor_max_workers)]
+        if self.thread_pool_executor:
+            samples.append(("syncany_executor_threads", (), len(self.thread_pool_executor._threads)))
+        for key, value in self.query_scheduler.get_stats().items():
+            samples.append(("syncany_scheduler_" + key, (), value))
+        for key, value in self.result_cache.get_stats().items():
+            samples.append(("syncany_result_cache_" + key, (), value))
+        for key, value in self.memory_budget.get_stats().items():
+            samples.append(("syncany_memory_budget_" + key, (), value))
+        for (database_name, table_name), stats in self.materialized_store.get_stats().items():
+            labels = (("database", database_name), ("table", table_name))
+            samples.append(("syncany_materialized_rows", labels, stats["rows"]))
+            samples.append(("syncany_materialized_age_seconds", labels, stats["age"]))
+        if self.script_engine:
+            for stat_key in ("factorys", "idle", "using"):
+                for driver, driver_stats in self.script_engine.manager.database_manager.get_stats().items():
+                    samples.append(("syncany_database_drivers_" + stat_key, (("driver", driver),),
+                                    driver_stats[stat_key]))
+            samples.append(("syncany_database_acquires_total", (),
+                            self.script_engine.manager.database_manager.acquire_count))
+            for database_name, pool_stats in self.script_engine.manager.database_manager.get_pool_stats().items():
+                for stat_key, value in pool_stats.items():
+                    samples.append(("syncany_database_pool_" + stat_key, (("database", database_name),), value))
+        return samples
 
-        Database.scan_databases(self.config_path, self.script_engine, self.databases, self.is_scan_database)
+    async def start_server(self, **kwargs):
+        self.setup_script_engine()
+        self.install_compiler_hooks(self.catalog, self.plan_cache)
+        Database.scan_databases(self.config_path, self.script_engine, self.catalog, self.is_scan_database,
+                                self.table_script_cache, True, self.scan_manifest)
+        self.script_engine.manager.database_manager.warmup()
         await super(Server, self).start_server(host=self.host, port=self.port,
                                                reuse_port=True if sys.platform != "win32" else None,
                                                backlog=512, **kwargs)
-        asyncio.get_running_loop().call_later(5 * 60, self.script_engine.manager.database_manager.check_timeout)
+        self.metrics.register_collector(self.collect_metrics)
+        if self.reload_interval and self.reload_interval > 0:
+            self.config_watcher = ConfigWatcher(self.config_path, self.reload_catalog, self.reload_interval,
+                                                ignore_filenames=[os.path.basename(self.scan_manifest)]
+                                                if self.scan_manifest else None)
+            self.config_watcher.start()
+        self.materialized_refresher = MaterializedRefresher(self.catalog, self.materialized_store,
+                                                            self.refresh_materialized_table, self.metrics)
+        self.materialized_refresher.start()
+        if self.metrics_port:
+            self.metrics_server = await asyncio.start_server(self.metrics.handle_http, "127.0.0.1", self.metrics_port)
+            get_logger().info("metrics serving on 127.0.0.1:%d", self.metrics_port)
+        elif self.metrics_path:
+            self.metrics_server = await asyncio.start_unix_server(self.metrics.handle_http, self.metrics_path)
+        database_manager = self.script_engine.manager.database_manager
+        asyncio.get_running_loop().call_later(database_manager.get_check_interval(), database_manager.check_timeout)
         get_logger().info("server serving")
 
     def close(self):
         get_logger().info("server closing")
         super(Server, self).close()
 
+        if self.config_watcher:
+            self.config_watcher.close()
+        self.config_watcher = None
+        if self.materialized_refresher:
+            self.materialized_refresher.close()
+        self.materialized_refresher = None
+        if self.metrics_server:
+            self.metrics_server.close()
+        self.metrics_server = None
+        if self.process_query_executor:
+            self.process_query_executor.shutdown()
+        self.process_query_executor = None
         if self.script_engine:
             self.script_engine.close()
         self.script_engine = None
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import asyncio
+import pickle
+import tempfile
+import threading
+from itertools import islice
+from .encoder import ResultEncoder
+from .metrics import get_rows_bytes
+
+SPILL_BATCH_SIZE = 4096
+
+
+class MemoryBudget(object):
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.spills = 0
+        self.spilled_rows = 0
+        self.spilled_bytes = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        with self.lock:
+            if self.limit > 0 and self.used + size > self.limit:
+                return False
+            self.used += size
+            if self.used > self.peak:
+                self.peak = self.used
+            return True
+
+    def release(self, size):
+        with self.lock:
+            self.used = max(self.used - size, 0)
+
+    def record_spill(self, rows, size, is_new=False):
+        with self.lock:
+            if is_new:
+                self.spills += 1
+            self.spilled_rows += rows
+            self.spilled_bytes += size
+
+    def get_stats(self):
+        with self.lock:
+            return {"limit": self.limit, "used": self.used, "peak": self.peak, "spills": self.spills,
+                    "spilled_rows": self.spilled_rows, "spilled_bytes": self.spilled_bytes}
+
+
+class MemoryRows(list):
+    def __init__(self, memory_budget):
+        super(MemoryRows, self).__init__()
+
+        self.memory_budget = memory_budget
+        self.size = 0
+
+    def close(self):
+        if self.size:
+            self.memory_budget.release(self.size)
+            self.size = 0
+
+
+class SpilledRows(object):
+    def __init__(self, file, head_rows, row_count, executor=None):
+        self.file = file
+        self.head_rows = head_rows
+        self.row_count = row_count
+        self.executor = executor
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.row_count
+
+    def load(self, offset):
+        with self.lock:
+            self.file.seek(offset)
+            try:
+                rows = pickle.load(self.file)
+            except EOFError:
+                return None, offset
+            return rows, self.file.tell()
+
+    def __iter__(self):
+        rows, offset = self.load(0)
+        while rows is not None:
+            for row in rows:
+                yield row
+            rows, offset = self.load(offset)
+
+    def __aiter__(self):
+        return self.iter_rows()
+
+    async def iter_rows(self):
+        loop = asyncio.get_running_loop()
+        rows, offset = await loop.run_in_executor(self.executor, self.load, 0)
+        while rows is not None:
+            for row in rows:
+                yield row
+            rows, offset = await loop.run_in_executor(self.executor, self.load, offset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.row_count)
+            if stop <= len(self.head_rows):
+                return self.head_rows[index]
+            return list(islice(self, start, stop, step))
+        if index < 0:
+            index += self.row_count
+        if index < 0 or index >= self.row_count:
+            raise IndexError("spilled rows index out of range")
+        if index < len(self.head_rows):
+            return self.head_rows[index]
+        return next(islice(self, index, None))
+
+    async def aclose(self):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class SpillDatas(list):
+    def __init__(self, executer_context, memory_budget, query_limit=0, spill_path=None):
+        super(SpillDatas, self).__init__()
+
+        self.executer_context = executer_context
+        self.memory_budget = memory_budget
+        self.query_limit = query_limit
+        self.spill_path = spill_path
+        self.encoder = None
+        self.rows = MemoryRows(memory_budget)
+        self.size = 0
+        self.file = None
+        self.head_rows = None
+        self.row_count = 0
+        self.finished = False
+
+    def extend(self, datas):
+        if not datas:
+            return
+        if self.encoder is None:
+            self.encoder = ResultEncoder(list(datas[0].keys()), self.executer_context.output_schema)
+        rows = self.encoder.encode(datas)
+        size = get_rows_bytes(rows)
+        self.row_count += len(rows)
+        if self.file is None and (not self.query_limit or self.size + size <= self.query_limit) \
+                and self.memory_budget.reserve(size):
+            self.rows.extend(rows)
+            self.size += size
+            return
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix="syncany-spill-", dir=self.spill_path)
+            self.head_rows = self.rows[:SPILL_BATCH_SIZE]
+            self.write(self.rows, self.size, True)
+            self.memory_budget.release(self.size)
+            self.rows, self.size = MemoryRows(self.memory_budget), 0
+        if len(self.head_rows) < SPILL_BATCH_SIZE:
+            self.head_rows.extend(rows[:SPILL_BATCH_SIZE - len(self.head_rows)])
+        self.write(rows, size)
+
+    def write(self, rows, size, is_new=False):
+        for i in range(0, len(rows), SPILL_BATCH_SIZE):
+            pickle.dump(rows[i: i + SPILL_BATCH_SIZE], self.file, pickle.HIGHEST_PROTOCOL)
+        self.memory_budget.record_spill(len(rows), size, is_new)
+
+    def get_size(self):
+        return self.size
+
+    def result(self, executor=None):
+        self.finished = True
+        if self.encoder is None:
+            return [], []
+        if self.file is None:
+            rows, self.rows = self.rows, MemoryRows(self.memory_budget)
+            rows.size, self.size = self.size, 0
+            return rows, self.encoder.columns
+        self.file.flush()
+        return SpilledRows(self.file, self.head_rows, self.row_count, executor), self.encoder.columns
+
+    def close(self):
+        if self.size:
+            self.memory_budget.release(self.size)
+            self.rows, self.size = MemoryRows(self.memory_budget), 0
+        if self.file is not None and not self.finished:
+            self.file.close()
+        self.file = None
+
+
+def close_result(result):
+    rows = result[0] if isinstance(result, tuple) and result else getattr(result, "rows", None)
+    if isinstance(rows, (MemoryRows, SpilledRows)):
+        rows.close()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import asyncio
+from mysql_mimic.results import ResultSet
+from .encoder import ResultEncoder
+from .metrics import get_rows_bytes
+
+
+class ResultStreamClosed(Exception):
+    pass
+
+
+class ResultStream(object):
+    FINISHED = object()
+
+    def __init__(self, loop, batch_size, max_queue_size=4):
+        self.loop = loop
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue(max_queue_size)
+        self.closed = False
+        self.finished = False
+        self.columns = None
+        self.row_count = 0
+        self.bytes = 0
+
+    def put(self, columns, rows):
+        if self.closed:
+            raise ResultStreamClosed()
+        if self.columns is None:
+            self.columns = columns
+        self.row_count += len(rows)
+        self.bytes += get_rows_bytes(rows)
+        asyncio.run_coroutine_threadsafe(self.queue.put(rows), self.loop).result()
+        if self.closed:
+            raise ResultStreamClosed()
+
+    def finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        if self.closed:
+            return
+        asyncio.run_coroutine_threadsafe(self.queue.put(error if error is not None else self.FINISHED),
+                                         self.loop).result()
+
+    async def get(self):
+        item = await self.queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    async def result(self):
+        try:
+            rows = await self.get()
+        except BaseException:
+            self.close()
+            raise
+        if rows is self.FINISHED:
+            return [], []
+        return ResultSet(rows=self.iter_rows(rows), columns=self.columns)
+
+    async def iter_rows(self, rows):
+        try:
+            while rows is not self.FINISHED:
+                for row in rows:
+                    yield row
+                rows = await self.get()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class ResultStreamDatas(list):
+    def __init__(self, result_stream, executer_context):
+        super(ResultStreamDatas, self).__init__()
+
+        self.result_stream = result_stream
+        self.executer_context = executer_context
+        self.encoder = None
+
+    def extend(self, datas):
+        if not datas:
+            return
+        if self.encoder is None:
+            self.encoder = ResultEncoder(list(datas[0].keys()), self.executer_context.output_schema)
+        rows = self.encoder.encode(datas)
+        self.result_stream.put(self.encoder.columns, rows)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import os
+import time
+import asyncio
+import errno
+import select
+import shutil
+import signal
+import socket
+import tempfile
+from syncany.logger import get_logger
+from .metrics import Metrics, merge_renders
+
+WORKER_READY_TIMEOUT = 120
+WORKER_STOP_TIMEOUT = 30
+WORKER_MIN_UPTIME = 5
+WORKER_RESTART_DELAY = 1
+WORKER_MAX_RESTART_DELAY = 30
+METRICS_TIMEOUT = 5
+
+
+class Worker(object):
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.ready_fd = None
+        self.started_time = 0
+        self.restart_time = 0
+        self.restart_delay = 0
+        self.restarts = 0
+
+
+class WorkerSupervisor(object):
+    def __init__(self, worker_count, run_worker, metrics_port=0):
+        self.workers = [Worker(index) for index in range(worker_count)]
+        self.run_worker = run_worker
+        self.metrics_port = metrics_port
+        self.metrics = Metrics()
+        self.metrics_socket = None
+        self.runtime_path = None
+        self.stopping_pids = set()
+        self.closed = False
+        self.reloading = False
+
+        self.metrics.describe("syncany_workers", "gauge", "Worker processes running")
+        self.metrics.describe("syncany_worker_restarts_total", "counter", "Worker processes restarted after exiting")
+        self.metrics.describe("syncany_worker_reloads_total", "counter", "Coordinated reloads of all worker processes")
+        self.metrics.register_collector(self.collect_metrics)
+
+    def get_metrics_path(self, pid):
+        return os.path.join(self.runtime_path, "worker-%d.sock" % pid)
+
+    def start_worker(self, worker):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            exit_code = 0
+            try:
+                for signum in (signal.SIGHUP, signal.SIGTERM):
+                    signal.signal(signum, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                if self.metrics_socket is not None:
+                    self.metrics_socket.close()
+
+                def ready():
+                    os.write(write_fd, b"1")
+                    os.close(write_fd)
+                self.run_worker(worker.index, self.get_metrics_path(os.getpid()), ready)
+            except asyncio.CancelledError:
+                pass
+            except BaseException as e:
+                get_logger().error("worker %d error: %s", worker.index, e)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        os.close(write_fd)
+        worker.pid, worker.ready_fd, worker.started_time = pid, read_fd, time.time()
+        get_logger().info("worker %d started pid %d", worker.index, pid)
+        return pid
+
+    def wait_ready(self, worker, timeout=WORKER_READY_TIMEOUT):
+        if worker.ready_fd is None:
+            return worker.pid is not None
+        try:
+            end_time = time.time() + timeout
+            while not self.closed:
+                readable, _, _ = select.select([worker.ready_fd], [], [], min(max(end_time - time.time(), 0), 0.5))
+                if readable:
+                    return os.read(worker.ready_fd, 1) == b"1"
+                if time.time() >= end_time:
+                    return False
+            return False
+        finally:
+            os.close(worker.ready_fd)
+            worker.ready_fd = None
+
+    def stop_pids(self, pids, timeout=WORKER_STOP_TIMEOUT):
+        for pid in pids:
+            self.stopping_pids.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        end_time = time.time() + timeout
+        while time.time() < end_time:
+            self.reap_workers()
+            if not any(pid in self.stopping_pids for pid in pids):
+                return
+            time.sleep(0.1)
+        for pid in pids:
+            if pid not in self.stopping_pids:
+                continue
+            get_logger().warning("worker pid %d stop timeout, killing", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.stopping_pids.discard(pid)
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.stopping_pids:
+                self.stopping_pids.discard(pid)
+                continue
+            for worker in self.workers:
+                if worker.pid != pid:
+                    continue
+                if worker.ready_fd is not None:
+                    os.close(worker.ready_fd)
+                    worker.ready_fd = None
+                now = time.time()
+                if now - worker.started_time < WORKER_MIN_UPTIME:
+                    worker.restart_delay = min(max(worker.restart_delay * 2, WORKER_RESTART_DELAY),
+                                               WORKER_MAX_RESTART_DELAY)
+                else:
+                    worker.restart_delay = 0
+                worker.pid, worker.restart_time = None, now + worker.restart_delay
+                get_logger().warning("worker %d pid %d exited with status %d, restarting in %ds", worker.index, pid,
+                                     os.waitstatus_to_exitcode(status), worker.restart_delay)
+                break
+
+    def restart_workers(self):
+        now = time.time()
+        for worker in self.workers:
+            if worker.pid is None and worker.restart_time <= now and not self.closed:
+                worker.restarts += 1
+                self.metrics.inc("syncany_worker_restarts_total", (("worker", str(worker.index)),))
+                self.start_worker(worker)
+
+    def reload_workers(self):
+        get_logger().info("workers reloading")
+        for worker in self.workers:
+            if self.closed:
+                return
+            if worker.pid is None:
+                continue
+            old_pid = worker.pid
+            new_worker = Worker(worker.index)
+            self.start_worker(new_worker)
+            if not self.wait_ready(new_worker):
+                get_logger().error("worker %d reload failed, keeping pid %d", worker.index, old_pid)
+                self.stop_pids([new_worker.pid])
+                return
+            worker.pid, worker.started_time, worker.restart_delay = new_worker.pid, new_worker.started_time, 0
+            self.stop_pids([old_pid])
+        self.metrics.inc("syncany_worker_reloads_total")
+        get_logger().info("workers reloaded")
+
+    def stop_workers(self):
+        self.stop_pids([worker.pid for worker in self.workers if worker.pid is not None])
+        for worker in self.workers:
+            worker.pid = None
+
+    def collect_metrics(self):
+        return [("syncany_workers", (), len([worker for worker in self.workers if worker.pid is not None]))]
+
+    def read_worker_metrics(self, worker):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(METRICS_TIMEOUT)
+            client.connect(self.get_metrics_path(worker.pid))
+            client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+            buffers = []
+            while True:
+                data = client.recv(65536)
+                if not data:
+                    break
+                buffers.append(data)
+        header, _, body = b"".join(buffers).partition(b"\r\n\r\n")
+        if not header.startswith(b"HTTP/1.1 200"):
+            raise IOError("worker metrics response error: %s" % header.split(b"\r\n")[0].decode("utf-8", "replace"))
+        return body.decode("utf-8")
+
+    def render_metrics(self):
+        renders = [(None, self.metrics.render())]
+        for worker in self.workers:
+            if worker.pid is None or worker.ready_fd is not None:
+                continue
+            try:
+                renders.append((str(worker.index), self.read_worker_metrics(worker)))
+            except Exception as e:
+                get_logger().warning("worker %d metrics error: %s", worker.index, e)
+        return merge_renders(renders, "worker")
+
+    def handle_metrics(self):
+        try:
+            client, _ = self.metrics_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        with client:
+            try:
+                client.settimeout(METRICS_TIMEOUT)
+                request = b""
+                while b"\r\n\r\n" not in request and b"\n\n" not in request and len(request) < 65536:
+                    data = client.recv(4096)
+                    if not data:
+                        break
+                    request += data
+                request_line = request.split(b"\n", 1)[0].strip()
+                path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b"/"
+                if path.split(b"?")[0] in (b"/", b"/metrics"):
+                    status, body = b"200 OK", self.render_metrics().encode("utf-8")
+                else:
+                    status, body = b"404 Not Found", b"not found\n"
+                client.sendall(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                               b"Content-Length: " + str(len(body)).encode("utf-8") + b"\r\nConnection: close\r\n\r\n"
+                               + body)
+            except Exception as e:
+                get_logger().warning("metrics http request error: %s", e)
+
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self.reloading = True
+        elif signum in (signal.SIGTERM, signal.SIGINT):
+            self.closed = True
+
+    def run(self):
+        self.runtime_path = tempfile.mkdtemp(prefix="syncany-workers-")
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.handle_signal)
+        try:
+            if self.metrics_port:
+                self.metrics_socket = socket.create_server(("127.0.0.1", self.metrics_port))
+                self.metrics_socket.setblocking(False)
+                get_logger().info("metrics serving on 127.0.0.1:%d", self.metrics_port)
+            for worker in self.workers:
+                self.start_worker(worker)
+            for worker in self.workers:
+                if not self.wait_ready(worker) and not self.closed:
+                    get_logger().error("worker %d start failed", worker.index)
+            get_logger().info("supervisor serving with %d workers", len(self.workers))
+            while not self.closed:
+                self.reap_workers()
+                if self.reloading:
+                    self.reloading = False
+                    self.reload_workers()
+                    continue
+                self.restart_workers()
+                starting_workers = [worker for worker in self.workers if worker.ready_fd is not None]
+                try:
+                    readable, _, _ = select.select(([self.metrics_socket] if self.metrics_socket else [])
+                                                   + [worker.ready_fd for worker in starting_workers], [], [], 0.5)
+                except OSError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+                    continue
+                for worker in starting_workers:
+                    if worker.ready_fd in readable and not self.wait_ready(worker, 0):
+                        get_logger().error("worker %d start failed", worker.index)
+                if self.metrics_socket is not None and self.metrics_socket in readable:
+                    self.handle_metrics()
+        finally:
+            get_logger().info("supervisor closing")
+            self.stop_workers()
+            if self.metrics_socket is not None:
+                self.metrics_socket.close()
+            self.metrics_socket = None
+            shutil.rmtree(self.runtime_path, ignore_errors=True)
+            get_logger().info("supervisor closed")
@@ -8,11 +8,16 @@ from syncany.filters import IntFilter, FloatFilter, StringFilter, BytesFilter, B
 
 
 class Table(object):
-    def __init__(self, name, filename, schema, primary_keys=None):
+    def __init__(self, name, filename, schema, primary_keys=None, options=None):
         self.name = name
         self.filename = filename
         self.schema = schema
         self.primary_keys = primary_keys
+        self.options = options or {}
+
+    def copy(self, schema=None, options=None):
+        return Table(self.name, self.filename, dict(self.schema) if schema is None else schema, self.primary_keys,
+                     dict(self.options) if options is None else options)
 
     @classmethod
     def parse_schema(cls, tasker):
@@ -15,6 +15,8 @@ class UserIdentityProvider(IdentityProvider):
         self.password = password
         self.default_is_readonly = is_readonly
         self.users = None
+        self.database_configs = {}
+        self.version = None
 
     def get_plugins(self):
         return [NativePasswordAuthPlugin()]
@@ -54,8 +56,35 @@ class UserIdentityProvider(IdentityProvider):
             return (permission in user["permissions"]) if "permissions" in user else True
         return (permission in user["permissions"]) if "permissions" in user else False
 
+    def get_concurrency(self, username):
+        if self.users is None:
+            self.load_users()
+        user = self.users.get(username)
+        return int(user["concurrency"]) if user and user.get("concurrency") else 0
+
+    def get_memory_limit(self, username):
+        if self.users is None:
+            self.load_users()
+        user = self.users.get(username)
+        return int(float(user["memory_limit"]) * 1024 * 1024) if user and user.get("memory_limit") else 0
+
+    def get_database_concurrency(self, database):
+        database_config = self.database_configs.get(database)
+        return int(database_config["concurrency"]) if database_config and database_config.get("concurrency") else 0
+
+    def get_version(self):
+        versions = []
+        for filename in (os.path.join(self.config_path, "user.json"), os.path.join(self.config_path, "user.yaml")):
+            try:
+                stat = os.stat(filename)
+                versions.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
     def load_users(self):
-        users = {}
+        version = self.get_version()
+        users, database_configs = {}, {}
         for filename in (os.path.join(self.config_path, "user.json"), os.path.join(self.config_path, "user.yaml")):
             if not os.path.exists(filename):
                 continue
@@ -64,6 +93,9 @@ class UserIdentityProvider(IdentityProvider):
                 continue
             if isinstance(config, dict):
                 config_users = config["users"] if "users" in config and isinstance(config["users"], list) else None
+                if "databases" in config and isinstance(config["databases"], dict):
+                    database_configs.update({name: database_config for name, database_config
+                                             in config["databases"].items() if isinstance(database_config, dict)})
             else:
                 config_users = config
             if not config_users:
@@ -75,4 +107,6 @@ class UserIdentityProvider(IdentityProvider):
         if not users and self.username:
             users[self.username] = {"username": self.username, "password": self.password}
         self.users = users
+        self.database_configs = database_configs
+        self.version = version
         get_logger().info("load users finish, users: %s", ",".join(list(users.keys())))
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import os
+import sys
+import time
+import select
+import struct
+import threading
+from syncany.logger import get_logger
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+                | IN_DELETE_SELF
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+def load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1") or not hasattr(libc, "inotify_add_watch"):
+            return None
+        libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        return libc
+    except Exception:
+        return None
+
+
+class ConfigWatcher(object):
+    def __init__(self, config_path, callback, interval=2, delay=0.5, ignore_filenames=None):
+        self.config_path = config_path
+        self.callback = callback
+        self.interval = interval
+        self.delay = delay
+        self.ignore_filenames = set(ignore_filenames or [])
+        self.inotify = load_inotify()
+        self.inotify_fd = None
+        self.snapshot = None
+        self.closed = False
+        self.thread = None
+
+    def start(self):
+        if self.inotify is not None:
+            inotify_fd = self.inotify.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if inotify_fd >= 0:
+                self.inotify_fd = inotify_fd
+                self.add_watches()
+        if self.inotify_fd is None:
+            self.snapshot = self.take_snapshot()
+        self.thread = threading.Thread(target=self.run, name="syncany-config-watcher", daemon=True)
+        self.thread.start()
+        get_logger().info("config watcher started by %s on %s", "inotify" if self.inotify_fd is not None else "polling",
+                          self.config_path)
+
+    def add_watches(self):
+        dirpaths = [self.config_path] + [os.path.join(self.config_path, dirname) for dirname in os.listdir(self.config_path)]
+        for dirpath in dirpaths:
+            if not os.path.isdir(dirpath):
+                continue
+            if self.inotify.inotify_add_watch(self.inotify_fd, os.fsencode(dirpath), IN_WATCH_MASK) < 0:
+                get_logger().warning("config watcher add watch error %s", dirpath)
+
+    def is_ignored(self, filename):
+        for ignore_filename in self.ignore_filenames:
+            if filename == ignore_filename or (filename.startswith(ignore_filename + ".") and filename.endswith(".tmp")):
+                return True
+        return False
+
+    def take_snapshot(self):
+        snapshot = {}
+        dirpaths = [self.config_path]
+        while dirpaths:
+            dirpath = dirpaths.pop()
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            for entry in entries:
+                if self.is_ignored(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                if dirpath == self.config_path and entry.is_dir():
+                    dirpaths.append(entry.path)
+        return snapshot
+
+    def read_events(self):
+        filenames, buffer = [], b""
+        while True:
+            try:
+                data = os.read(self.inotify_fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            buffer += data
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(buffer):
+            _, _, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            filenames.append(buffer[offset: offset + name_length].rstrip(b"\0").decode("utf-8", "replace"))
+            offset += name_length
+        return filenames
+
+    def wait_changed(self):
+        if self.inotify_fd is None:
+            time.sleep(self.interval)
+            snapshot = self.take_snapshot()
+            if snapshot == self.snapshot:
+                return False
+            self.snapshot = snapshot
+            return True
+        readables, _, _ = select.select([self.inotify_fd], [], [], self.interval)
+        if not readables:
+            return False
+        time.sleep(self.delay)
+        return any(not filename or not self.is_ignored(filename) for filename in self.read_events())
+
+    def run(self):
+        while not self.closed:
+            try:
+                if not self.wait_changed() or self.closed:
+                    continue
+                if self.inotify_fd is not None:
+                    self.add_watches()
+                self.callback()
+            except Exception as e:
+                if self.closed:
+                    break
+                get_logger().warning("config watcher reload error: %s", e)
+                time.sleep(self.interval)
+
+    def close(self):
+        self.closed = True
+        if self.inotify_fd is not None:
+            try:
+                os.close(self.inotify_fd)
+            except OSError:
+                pass
+        self.inotify_fd = None
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# 2026/10/18
+# create by: snower
+
+import unittest
+from syncanyserver.plan import QueryPlanCache, build_value_expression
+from syncanyserver.server import ServerSession
+
+
+class QueryPlanCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dialect = ServerSession.dialect()
+        self.plan_cache = QueryPlanCache()
+
+    def test_prepare(self):
+        plan = self.plan_cache.prepare(self.dialect, "select id from oms_order where id = ? and order_sn = ?")
+        self.assertIsNotNone(plan)
+        expressions = plan.bind([build_value_expression(5), build_value_expression("a'b")])
+        self.assertEqual(expressions[0].sql(dialect=self.dialect),
+                         "SELECT id FROM oms_order WHERE id = 5 AND order_sn = 'a''b'")
+
+    def test_parse(self):
+        for sql in ("select id from oms_order where id = 5",
+                    "select id, 'a', -3 from oms_order where status in (1, 2) and note like 'a%' limit 10 offset 2",
+                    "select id from oms_order where create_time > now() - interval 1 day",
+                    "select cast(id as varchar(10)) from oms_order where id between 1 and 5 order by id",
+                    "select member_id, count(*) from oms_order group by member_id having count(*) > 2"):
+            self.plan_cache.parse(self.dialect, sql)
+            self.assertEqual(self.plan_cache.parse(self.dialect, sql), self.dialect.parse(sql), sql)
+        self.assertEqual(self.plan_cache.get_stats()["hits"], 5)
+
+    def test_unplanned_stats(self):
+        self.plan_cache.set("unplanned", False)
+        self.assertIs(self.plan_cache.get("unplanned"), False)
+        self.assertEqual(self.plan_cache.get_stats()["hits"], 0)
+        self.assertEqual(self.plan_cache.get_stats()["misses"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()